@@ -0,0 +1,81 @@
+"""
+This script compares the autoML and binning methods of ExpectedPower on synthetic scada data:
+fit time, predict throughput and error on the normal operation records of hold-out data.
+
+Example:
+    python benchmarks/automl_vs_binning.py --sizes 100000 1000000 --turbines 20 --output automl.json
+"""
+import sys
+import json
+import time
+import argparse
+import warnings
+
+import numpy as np
+
+sys.path.extend(['.', '..'])
+
+from scada_data_analysis.utils.synthetic_data import generate_scada_data
+from scada_data_analysis.modules.expected_power import ExpectedPower
+
+from run_benchmarks import LABELS, environment
+
+# method, predict settings and name of every compared model
+MODELS = [('binning', dict(compiled=False), 'binning'),
+          ('binning', dict(compiled=True), 'binning[compiled]'),
+          ('autoML', dict(), 'autoML')]
+
+
+def run(sizes, n_turbines, kind, seed):
+    results = []
+    for n_records in sizes:
+        train_df = generate_scada_data(n_turbines=n_turbines, n_records=n_records, seed=seed, **LABELS)
+        test_df = generate_scada_data(n_turbines=n_turbines, n_records=n_records, seed=seed + 1, **LABELS)
+        # errors are measured against records without injected events
+        normal = (test_df['event'] == 'normal').to_numpy()
+        power = test_df[LABELS['power_label']].to_numpy(dtype=float)
+
+        fit_times = {}
+        for method, predict_params, name in MODELS:
+            if method not in fit_times:
+                start = time.perf_counter()
+                power_model = ExpectedPower(method=method, kind=kind, engine='vectorized', **LABELS).fit(train_df)
+                fit_times[method] = time.perf_counter() - start
+                if method == 'binning':
+                    power_model.compile()
+
+            start = time.perf_counter()
+            expected_power = power_model.predict(test_df, return_series=True, **predict_params).to_numpy(dtype=float)
+            predict_time = time.perf_counter() - start
+
+            error = (expected_power - power)[normal & ~np.isnan(expected_power)]
+            results.append(dict(model=name, n_records=n_records, n_turbines=n_turbines, fit_time_s=fit_times[method],
+                                predict_rows_per_s=len(test_df)/predict_time,
+                                mae=float(np.abs(error).mean()), rmse=float(np.sqrt((error**2).mean()))))
+            print(f"{name:<18} {n_records:>10} rows  fit {fit_times[method]:8.3f} s  "
+                  f"predict {len(test_df)/predict_time:12.0f} rows/s  "
+                  f"MAE {results[-1]['mae']:8.2f}  RMSE {results[-1]['rmse']:8.2f}")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000],
+                        help='numbers of training and test records')
+    parser.add_argument('--turbines', type=int, default=10, help='number of turbines in the synthetic data')
+    parser.add_argument('--kind', default='linear', help='interpolation kind of the binning method')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic training data')
+    parser.add_argument('--output', default='automl_results.json', help='path of the json results file')
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore')
+    results = run(args.sizes, args.turbines, args.kind, args.seed)
+
+    with open(args.output, 'w') as f:
+        json.dump(dict(environment=environment(), results=results), f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+This script times and memory-profiles the filtering and expected power functions on synthetic scada data.
+
+Example:
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 1000000 --turbines 20 --output results.json
+    python benchmarks/run_benchmarks.py --sizes 10000 --compare results.json
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.extend(['.', '..'])
+
+from scada_data_analysis.utils.binning_function import binning_func
+from scada_data_analysis.utils.sparse_binning import sparse_binning_func
+from scada_data_analysis.utils.synthetic_data import generate_scada_data
+from scada_data_analysis.modules.power_curve_preprocessing import PowerCurveFiltering
+from scada_data_analysis.modules.expected_power import ExpectedPower
+
+LABELS = dict(turbine_label='Wind_turbine_name', windspeed_label='Ws_avg', power_label='P_avg')
+
+
+def bench_binning_func(data):
+    turbine_df = data[data[LABELS['turbine_label']] == data[LABELS['turbine_label']].iloc[0]]
+    return lambda: binning_func(turbine_df, LABELS['windspeed_label'], LABELS['power_label'], 0.5)
+
+
+def bench_sparse_binning_func(data):
+    turbine_df = data[data[LABELS['turbine_label']] == data[LABELS['turbine_label']].iloc[0]]
+    return lambda: sparse_binning_func(turbine_df, LABELS['windspeed_label'], LABELS['power_label'], 0.5)
+
+
+def bench_secondary_filter(data):
+    pc_filter = PowerCurveFiltering(data=data, z_coeff=2.5, **LABELS)
+    pc_filter.remove_downtime_events()
+    pc_filter.no_dt_per_turbine_df = pc_filter.no_dt_df[pc_filter.no_dt_df[LABELS['turbine_label']] ==
+                                                        data[LABELS['turbine_label']].iloc[0]]
+    pc_filter.remove_fault_events_per_turbine()
+    return pc_filter.secondary_filter
+
+
+def bench_process(engine, binning='interval'):
+    def setup(data):
+        return PowerCurveFiltering(data=data, z_coeff=2.5, engine=engine, binning=binning, **LABELS).process
+    return setup
+
+
+def bench_fit(engine, binning='interval', method='binning'):
+    def setup(data):
+        return lambda: ExpectedPower(method=method, kind='linear', engine=engine, binning=binning, **LABELS).fit(data)
+    return setup
+
+
+def bench_predict(compiled, method='binning'):
+    def setup(data):
+        power_model = ExpectedPower(method=method, kind='linear', engine='vectorized', **LABELS).fit(data)
+        if compiled:
+            power_model.compile()
+        return lambda: power_model.predict(data, compiled=compiled)
+    return setup
+
+
+BENCHMARKS = {
+    'binning_func': bench_binning_func,
+    'sparse_binning_func': bench_sparse_binning_func,
+    'secondary_filter': bench_secondary_filter,
+    'process[pandas]': bench_process('pandas'),
+    'process[sparse]': bench_process('pandas', 'sparse'),
+    'process[vectorized]': bench_process('vectorized'),
+    'fit[pandas]': bench_fit('pandas'),
+    'fit[sparse]': bench_fit('vectorized', 'sparse'),
+    'fit[vectorized]': bench_fit('vectorized'),
+    'fit[autoML]': bench_fit('vectorized', method='autoML'),
+    'predict': bench_predict(False),
+    'predict[compiled]': bench_predict(True),
+    'predict[autoML]': bench_predict(False, method='autoML'),
+}
+
+
+def measure(func, repeat, trace_memory):
+    """
+    Returns the best wall time in seconds of repeat calls and, if trace_memory is true,
+    the peak memory in megabytes allocated by one further call
+    """
+    wall_times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        wall_times.append(time.perf_counter() - start)
+
+    peak_memory = None
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        func()
+        peak_memory = tracemalloc.get_traced_memory()[1]/1e6
+        tracemalloc.stop()
+
+    return min(wall_times), peak_memory
+
+
+def run(sizes, n_turbines, names, repeat, trace_memory, seed):
+    results = []
+    for n_records in sizes:
+        data = generate_scada_data(n_turbines=n_turbines, n_records=n_records, seed=seed, **LABELS)
+        for name in names:
+            func = BENCHMARKS[name](data)
+            wall_time, peak_memory = measure(func, repeat, trace_memory)
+            results.append(dict(benchmark=name, n_records=n_records, n_turbines=n_turbines,
+                                wall_time_s=wall_time, peak_memory_mb=peak_memory))
+            print(f"{name:<22} {n_records:>10} rows  {wall_time:10.4f} s" +
+                  (f"  {peak_memory:10.1f} MB" if peak_memory is not None else ''))
+        del data
+
+    return results
+
+
+def environment():
+    try:
+        from importlib.metadata import version
+        package_version = version('scada_data_analysis')
+    except Exception:
+        package_version = 'unknown'
+
+    return dict(package_version=package_version, python=platform.python_version(), numpy=np.__version__,
+                pandas=pd.__version__, platform=platform.platform(), processor=platform.processor(),
+                cpu_count=os.cpu_count(), timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'))
+
+
+def compare(results, baseline_path):
+    """
+    Prints the ratio of wall time and peak memory against a previous results file
+    """
+    with open(baseline_path) as f:
+        baseline = {(row['benchmark'], row['n_records'], row['n_turbines']): row for row in json.load(f)['results']}
+
+    print(f"\n{'benchmark':<22} {'rows':>10}  {'time ratio':>10}  {'memory ratio':>12}")
+    for row in results:
+        base = baseline.get((row['benchmark'], row['n_records'], row['n_turbines']))
+        if base is None:
+            continue
+        time_ratio = row['wall_time_s']/base['wall_time_s']
+        memory_ratio = (row['peak_memory_mb']/base['peak_memory_mb']
+                        if row['peak_memory_mb'] and base['peak_memory_mb'] else float('nan'))
+        print(f"{row['benchmark']:<22} {row['n_records']:>10}  {time_ratio:10.2f}  {memory_ratio:12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='numbers of records to benchmark, e.g. 10000 1000000 50000000')
+    parser.add_argument('--turbines', type=int, default=10, help='number of turbines in the synthetic data')
+    parser.add_argument('--benchmarks', nargs='+', default=list(BENCHMARKS), choices=list(BENCHMARKS),
+                        help='benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed calls, the best one is reported')
+    parser.add_argument('--no-memory', action='store_true', help='skip memory profiling, which is slow for large sizes')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--output', default='benchmark_results.json', help='path of the json results file')
+    parser.add_argument('--compare', help='path of a previous results file to compare against')
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore')
+    results = run(args.sizes, args.turbines, args.benchmarks, args.repeat, not args.no_memory, args.seed)
+
+    with open(args.output, 'w') as f:
+        json.dump(dict(environment=environment(), results=results), f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,77 @@
 """
 This module is used to estimate the expected power of a wind turbine generator.
 """
+import os
 import sys
+import json
+import warnings
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 from scipy.interpolate import interp1d
 
 sys.path.append('')
 
 from scada_data_analysis.utils.binning_function import binning_func
-from scada_data_analysis.modules.power_curve_preprocessing import PowerCurveFiltering
+from scada_data_analysis.utils.bin_statistics import (empty_bin_stats, add_bin_stats, truncate_bin_stats,
+                                                      resize_bin_stats, summarize_bin_stats, iter_chunks)
+from scada_data_analysis.utils.vectorized_filter import (windspeed_bin_codes, windspeed_bin_count, downtime_mask,
+                                                         power_thresholds, threshold_mask, group_max)
+from scada_data_analysis.utils.instrumentation import StageProfiler
+from scada_data_analysis.utils.sparse_binning import sparse_binning_func, condition_bin_codes
+from scada_data_analysis.modules.power_curve_preprocessing import PowerCurveFiltering, split_turbines, NORMAL
+
+# record layout of the per-turbine bin arrays written by ExpectedPower.save
+CURVE_DTYPE = np.dtype([('turbine', np.int32), ('windspeed_bin', np.float64), ('pwr_bin_mean', np.float64),
+                        ('pwr_bin_std', np.float64), ('count', np.float64)])
+
+# default LightGBM settings of the autoML method, num_threads=0 uses all processors
+AUTOML_PARAMS = dict(objective='regression', learning_rate=0.1, num_leaves=63, min_data_in_leaf=50,
+                     num_boost_round=200, num_threads=0, verbose=-1)
+
 
 class ExpectedPower:
     def __init__(self, turbine_label, windspeed_label, power_label, method=None, kind=None,
-                 cut_in_speed=3, bin_interval=0.5, z_coeff=2, filter_cycle=5) -> None:
+                 cut_in_speed=3, bin_interval=0.5, z_coeff=2, filter_cycle=5, engine='pandas',
+                 n_jobs=1, profiler=None, cache=None, binning='interval', condition_bins=None,
+                 automl_features=None, automl_params=None) -> None:
         """
         turbine_label:   Column name of unique turbine identifiers or turbine names
         windspeed_label: Column name of wind speed
         power_label:     Column name of active power
         method:          Specifies method for estimating expected power from processed training data.
-                         The string has to be 'binning' or 'autoML'
-        kind:            Only applies to the binning method and specifies the kind of interpolation
-                         to apply on binned data points. Available methods are: 'linear', 'quadratic' and 'cubic'.
+                         The string has to be 'binning' or 'autoML'. 'autoML' trains a single LightGBM model on the
+                         normal operation data of the whole fleet, with the turbine as a categorical feature, and
+                         scores all rows in one call. It requires lightgbm and the training data in memory (fit).
+        kind:            Specifies the kind of interpolation to apply on binned data points.
+                         Available methods are: 'linear', 'quadratic' and 'cubic'.
                          Quadratic and cubic methods use spline interpolation of second and third order respectively.
+                         The autoML method still fits binned curves for the clip limits, 'linear' if kind is None.
         cut_in_speed:    Cut in speed of turbine
         bin_interval:    Wind speed bin interval
         z_coeff:         Threshold of standard deviation used in filter 
                          within which operational data is considered normal
         filter_cycle:    Number of times to pass scada data through filter
+        engine:          Power curve filtering engine, 'pandas' or 'vectorized'
+        n_jobs:          Number of worker processes used to filter and fit turbines in parallel,
+                         -1 uses all processors
+        profiler:        Optional StageProfiler recording wall time, rows in, rows out and peak memory
+                         of every filtering stage and of fitting the curve of every turbine
+        cache:           Optional FilterCache holding the filtering results of previous fits, so fitting
+                         another method or kind on the same training data only rebuilds the curves
+        binning:         'interval' bins data with binning_func, 'sparse' with SparseBins, which reduces occupied
+                         bins only and gives the same curves
+        condition_bins:  Optional dictionary of column name and bin width of variables such as air density or
+                         wind direction. Besides the curve of every turbine, fit then builds one curve per occupied
+                         condition bin, which predict uses for data in that bin. Requires engine='vectorized' or
+                         binning='sparse'. Conditioned curves are not used by compiled predict, not updated by
+                         partial_fit, and not built by fit_chunks or saved by save.
+        automl_features: Optional list of further feature columns of the autoML method, e.g. wind direction
+                         or air density, besides turbine and wind speed
+        automl_params:   Optional dictionary of LightGBM parameters overriding AUTOML_PARAMS, e.g. num_boost_round
+                         or num_threads. The autoML model is not updated by partial_fit.
         """
         
         self.turbine_label = turbine_label
@@ -40,6 +83,15 @@ class ExpectedPower:
         self.bin_interval = bin_interval
         self.z_coeff = z_coeff
         self.filter_cycle = filter_cycle
+        self.engine = engine
+        self.n_jobs = n_jobs
+        self.profiler = profiler
+        self.cache = cache
+        self.binning = binning
+        self.condition_bins = condition_bins
+        self.automl_features = automl_features
+        self.automl_params = automl_params
+        self.automl_model = None
         
     
     def fit(self, training_data):
@@ -49,68 +101,714 @@ class ExpectedPower:
         training_data:   Pandas dataframe of scada data for extracting
                          production benchmark (typical operating condition)
         """
-        
-        # initialize power curve processing class
-        pc_filter = PowerCurveFiltering(self.turbine_label, self.windspeed_label, self.power_label,
-                                        training_data, self.cut_in_speed, self.bin_interval, self.z_coeff, self.filter_cycle)
 
-        # get data points during normal operating conditions (filtered data)
-        self.normal_df, _ = pc_filter.process()
-        
-        # get unique turbine names in training data
-        self.turbine_names = self.normal_df[self.turbine_label].unique()
-        
+        if self.method == 'autoML' and self.kind is None:
+            # binned curves of the autoML method only provide the clip limits
+            self.kind = 'linear'
+
         # instantiate a dictionary to store prediction functions and max power for each turbine
         self.pred_funcs_dict = dict()
-        self.max_power_dict = dict() 
-        
-        for turbine_name in self.turbine_names:
-            # extract filtered data for a single turbine
-            normal_temp_df = self.normal_df[self.normal_df[self.turbine_label] == turbine_name].copy()
-            if self.method == 'binning':
-                # bin filtered data before interpolation
-                binned_df = binning_func(normal_temp_df, self.windspeed_label, self.power_label, self.bin_interval)
-                # create turbine-level interpolation function for estimating expected power
-                f = interp1d(binned_df.windspeed_bin_median, binned_df.pwr_bin_mean, kind=self.kind, fill_value="extrapolate")
-            elif self.method == 'autoML':
-                print('AutoML method is yet to be released. Hence, reverting to binning method')
-                # bin filtered data before interpolation
-                binned_df = binning_func(normal_temp_df, self.windspeed_label, self.power_label, self.bin_interval)
-                # create turbine-level interpolation function for estimating expected power
-                f = interp1d(binned_df.windspeed_bin_median, binned_df.pwr_bin_mean, kind=self.kind, fill_value="extrapolate")
-                
+        self.max_power_dict = dict()
+        self.power_grid = None
+        self.automl_model = None
+
+        if self.cache is not None:
+            self.cached_fit(training_data)
+        elif self.n_jobs != 1:
+            self.parallel_fit(training_data)
+        else:
+            # initialize power curve processing class
+            pc_filter = PowerCurveFiltering(self.turbine_label, self.windspeed_label, self.power_label,
+                                            training_data, self.cut_in_speed, self.bin_interval, self.z_coeff,
+                                            self.filter_cycle, engine=self.engine, profiler=self.profiler,
+                                            binning=self.binning, condition_bins=self.condition_bins)
+
+            # get data points during normal operating conditions (filtered data)
+            self.normal_df, _ = pc_filter.process()
+            self.fit_turbine_curves(pc_filter)
+
+        if self.method == 'autoML':
+            self.fit_automl()
+
+        return self
+
+    def fit_automl(self):
+        """
+        Trains a single gradient boosted model on the normal operation data of all turbines, using multiple threads.
+        The turbine is a categorical feature, so turbines share the trees while keeping their own curve shape.
+        """
+        import lightgbm as lgb
+
+        params = dict(AUTOML_PARAMS, **(self.automl_params or {}))
+        num_boost_round = params.pop('num_boost_round')
+
+        self.automl_turbine_index = pd.Index(list(self.max_power_dict))
+        features = self.automl_feature_matrix(self.normal_df)
+        power = self.normal_df[self.power_label].to_numpy(dtype=np.float32)
+
+        train_set = lgb.Dataset(features, power, categorical_feature=[0], params=params)
+        self.automl_model = lgb.train(params, train_set, num_boost_round=num_boost_round)
+
+        return self
+
+    def automl_feature_matrix(self, data):
+        """
+        Returns: float32 feature matrix of the autoML method with the turbine code, wind speed and automl_features
+                 columns. Turbines missing from the training data get code -1, which LightGBM treats as missing.
+        """
+        columns = [self.windspeed_label] + list(self.automl_features or [])
+        features = np.empty((len(data), len(columns) + 1), dtype=np.float32)
+        features[:, 0] = self.automl_turbine_index.get_indexer(data[self.turbine_label])
+        for position, column in enumerate(columns, start=1):
+            features[:, position] = data[column].to_numpy(dtype=np.float32)
+
+        return features
+
+    def automl_predict(self, test_data):
+        """
+        Returns a numpy array of expected power for every row of test_data from a single batched call of the
+        autoML model, clipped between 0 and the maximum binned power of each turbine.
+        Rows of turbines missing from the training data get NaN.
+        """
+        features = self.automl_feature_matrix(test_data)
+        turbine_codes = features[:, 0].astype(np.int64)
+
+        num_threads = dict(AUTOML_PARAMS, **(self.automl_params or {}))['num_threads']
+        expected_power = self.automl_model.predict(features, num_threads=num_threads)
+
+        max_power = np.array([self.max_power_dict[turbine_name] for turbine_name in self.automl_turbine_index],
+                             dtype=float)
+        expected_power = np.clip(expected_power, 0, max_power[np.maximum(turbine_codes, 0)])
+        expected_power[(turbine_codes < 0) | np.isnan(features[:, 1])] = np.nan
+
+        return expected_power
+
+    def fit_turbine_curves(self, pc_filter):
+        """
+        Fits the curve of every turbine in normal_df
+        """
+        # get unique turbine names in training data
+        self.turbine_names = self.normal_df[self.turbine_label].unique()
+
+        # extract filtered data of every turbine in one pass
+        for turbine_name, normal_temp_df in self.normal_df.groupby(self.turbine_label, sort=False, observed=True):
+            stage_token = pc_filter.begin_stage()
+            f, max_power = _fit_turbine_curve(normal_temp_df, self.windspeed_label, self.power_label,
+                                              self.bin_interval, self.kind, self.binning)
+            pc_filter.end_stage(stage_token, 'fit_curve', len(normal_temp_df), len(f.x), turbine_name)
+
             self.pred_funcs_dict[turbine_name] = f
-            self.max_power_dict[turbine_name] = binned_df.pwr_bin_mean.round().max()
+            self.max_power_dict[turbine_name] = max_power
+
+        self.compute_bin_stats(pc_filter.data)
+        self.fit_condition_curves()
             
         return self
+
+    def cached_fit(self, training_data):
+        """
+        Takes the reason codes of the training data from the cache, filtering the data only on a cache miss,
+        then fits the curves of normal operation data
+        """
+        pc_filter = PowerCurveFiltering(self.turbine_label, self.windspeed_label, self.power_label,
+                                        training_data, self.cut_in_speed, self.bin_interval, self.z_coeff, self.filter_cycle,
+                                        engine=self.engine, n_jobs=self.n_jobs, profiler=self.profiler,
+                                        binning=self.binning, condition_bins=self.condition_bins)
+
+        filter_params = dict(cut_in_speed=self.cut_in_speed, bin_interval=self.bin_interval,
+                             z_coeff=self.z_coeff, filter_cycle=self.filter_cycle, condition_bins=self.condition_bins)
+        key = self.cache.key(training_data, self.turbine_label, self.windspeed_label, self.power_label, filter_params,
+                             list(self.condition_bins or {}))
+
+        reason_codes = self.cache.get(key)
+        if reason_codes is None:
+            reason_codes = pc_filter.process(output='codes')
+            self.cache.put(key, reason_codes)
+
+        self.normal_df = training_data[reason_codes == NORMAL]
+
+        return self.fit_turbine_curves(pc_filter)
+
+    def parallel_fit(self, training_data):
+        """
+        Filters and fits each turbine in a separate worker process.
+        Each worker receives only the turbine, wind speed and power columns of its turbine.
+        """
+        turbine_names, turbine_frames = [], []
+        for turbine_name, turbine_df in split_turbines(training_data, self.turbine_label, self.windspeed_label,
+                                                       self.power_label, list(self.condition_bins or {})):
+            turbine_names.append(turbine_name)
+            turbine_frames.append(turbine_df)
+
+        filter_params = dict(turbine_label=self.turbine_label, windspeed_label=self.windspeed_label,
+                             power_label=self.power_label, cut_in_speed=self.cut_in_speed,
+                             bin_interval=self.bin_interval, z_coeff=self.z_coeff,
+                             filter_cycle=self.filter_cycle, engine=self.engine, binning=self.binning,
+                             condition_bins=self.condition_bins)
+        curve_params = dict(windspeed_label=self.windspeed_label, power_label=self.power_label,
+                            bin_interval=self.bin_interval, kind=self.kind, binning=self.binning)
+
+        trace_memory = None if self.profiler is None else self.profiler.trace_memory
+
+        n_jobs = None if self.n_jobs == -1 else self.n_jobs
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_fit_turbine, turbine_frames, repeat(filter_params), repeat(curve_params),
+                                        repeat(trace_memory)))
+
+        normal_ind_list = []
+        for turbine_name, (normal_ind, f, max_power, records) in zip(turbine_names, results):
+            for record in records:
+                self.profiler.add(record)
+            if not normal_ind:
+                continue
+            normal_ind_list.extend(normal_ind)
+            self.pred_funcs_dict[turbine_name] = f
+            self.max_power_dict[turbine_name] = max_power
+
+        self.normal_df = training_data.loc[normal_ind_list]
+        self.turbine_names = np.array(list(self.pred_funcs_dict))
+
+        self.compute_bin_stats(training_data)
+        self.fit_condition_curves()
+
+        return self
+
+    def fit_condition_curves(self):
+        """
+        Creates one interpolation function per turbine and occupied condition bin of normal_df,
+        skipping condition bins with too few wind speed bins for the kind of interpolation
+        """
+        self.condition_funcs_dict = dict()
+        if not self.condition_bins:
+            return
+
+        condition_columns = [f"{column}_bin" for column in self.condition_bins]
+        for turbine_name, normal_temp_df in self.normal_df.groupby(self.turbine_label, sort=False, observed=True):
+            binned_df = sparse_binning_func(normal_temp_df, self.windspeed_label, self.power_label,
+                                            self.bin_interval, self.condition_bins)
+            for condition_codes, condition_df in binned_df.groupby(condition_columns):
+                try:
+                    f = interp1d(condition_df.windspeed_bin_median, condition_df.pwr_bin_mean, kind=self.kind,
+                                 fill_value="extrapolate")
+                except ValueError:
+                    continue
+                key = (turbine_name,) + (condition_codes if isinstance(condition_codes, tuple) else (condition_codes,))
+                self.condition_funcs_dict[key] = f
+
+    def compute_bin_stats(self, training_data):
+        """
+        Stores per-(turbine, bin) sufficient statistics of normal_df and the maximum power of the training data,
+        used to update the model with partial_fit
+        """
+        self.bin_turbine_index = pd.Index(list(self.pred_funcs_dict))
+
+        turbine_codes = self.bin_turbine_index.get_indexer(self.normal_df[self.turbine_label])
+        windspeed = self.normal_df[self.windspeed_label].to_numpy(dtype=float)
+        power = self.normal_df[self.power_label].to_numpy(dtype=float)
+        bin_codes = windspeed_bin_codes(windspeed, self.bin_interval)
+
+        n_turbines = len(self.bin_turbine_index)
+        max_windspeed = windspeed[np.isfinite(windspeed)].max() if np.isfinite(windspeed).any() else 0
+        self.bin_stats = empty_bin_stats(n_turbines, windspeed_bin_count(max_windspeed))
+        add_bin_stats(self.bin_stats, turbine_codes, bin_codes, windspeed, power)
+        truncate_bin_stats(self.bin_stats, group_max(windspeed, turbine_codes, turbine_codes >= 0, n_turbines))
+
+        self.turbine_max_power = np.full(n_turbines, np.nan)
+        self.update_turbine_max_power(training_data)
+
+    def update_turbine_max_power(self, data):
+        """
+        Updates the maximum power of non-downtime data of every turbine in bin_turbine_index with data.
+        As in fit and fit_chunks, this raw maximum, not the maximum binned power, sets the fault threshold.
+        """
+        turbine_codes = self.bin_turbine_index.get_indexer(data[self.turbine_label])
+        windspeed = data[self.windspeed_label].to_numpy(dtype=float)
+        power = data[self.power_label].to_numpy(dtype=float)
+        keep = (turbine_codes >= 0) & ~downtime_mask(windspeed, power, self.cut_in_speed)
+
+        n_turbines = len(self.bin_turbine_index)
+        turbine_max_power = np.append(self.turbine_max_power, np.full(n_turbines - len(self.turbine_max_power), np.nan))
+        self.turbine_max_power = np.fmax(turbine_max_power, group_max(power, turbine_codes, keep, n_turbines))
+
+    def partial_fit(self, new_data, forgetting_factor=0):
+        """
+        Updates a fitted model with new training data only, so the cost scales with the size of new_data.
+        New data of known turbines is screened for downtime, faults and power outside z_coeff standard
+        deviations of the stored bin statistics, while data of turbines seen for the first time and of bins
+        with fewer than 2 stored points, e.g. wind speeds not seen so far, is filtered with PowerCurveFiltering.
+        Only the curves and max_power_dict entries of turbines with new normal data are rebuilt, using the
+        mean wind speed of each bin. normal_df is not updated.
+
+        new_data:          Pandas dataframe of new scada data
+        forgetting_factor: Fraction of the stored statistics of an updated turbine that is forgotten before
+                           adding its new data, between 0 and 1. Values above 0 let curves follow seasonal drift.
+        """
+        if not hasattr(self, 'bin_stats'):
+            return self.fit(new_data)
+
+        if self.automl_model is not None:
+            warnings.warn("partial_fit only updates the binned curves and clip limits, the autoML model used by "
+                          "predict is not retrained. Call fit to retrain it on all data.")
+
+        windspeed = new_data[self.windspeed_label].to_numpy(dtype=float)
+        power = new_data[self.power_label].to_numpy(dtype=float)
+        bin_codes = windspeed_bin_codes(windspeed, self.bin_interval)
+
+        turbine_labels = new_data[self.turbine_label]
+        turbine_codes = self.bin_turbine_index.get_indexer(turbine_labels)
+        new_turbine = (turbine_codes < 0) & turbine_labels.notna().to_numpy()
+        if new_turbine.any():
+            self.bin_turbine_index = self.bin_turbine_index.append(pd.Index(turbine_labels[new_turbine].unique()))
+            turbine_codes = self.bin_turbine_index.get_indexer(turbine_labels)
+
+        n_bins = int(bin_codes.max()) + 1 if len(bin_codes) else 0
+        self.bin_stats = resize_bin_stats(self.bin_stats, len(self.bin_turbine_index), n_bins)
+        count, _, pwr_bin_mean, pwr_bin_std = summarize_bin_stats(self.bin_stats)
+
+        # bins with fewer than 2 stored points have no usable thresholds, e.g. wind speeds not seen so far
+        known = (turbine_codes >= 0) & ~new_turbine
+        binned = known & (bin_codes >= 0)
+        flat_codes = np.where(binned, turbine_codes*self.bin_stats.shape[2] + bin_codes, 0)
+        sparse_bin = binned & (count.ravel()[flat_codes] < 2)
+
+        # data of new turbines and of sparse bins is filtered on its own, together with the other new data
+        # of its turbine
+        self_filtered = new_turbine | np.isin(turbine_codes, np.unique(turbine_codes[sparse_bin]))
+        self_filtered_mask = np.zeros(len(new_data), dtype=bool)
+        if self_filtered.any():
+            pc_filter = PowerCurveFiltering(self.turbine_label, self.windspeed_label, self.power_label,
+                                            new_data[self_filtered], self.cut_in_speed, self.bin_interval, self.z_coeff,
+                                            self.filter_cycle, engine='vectorized')
+            self_filtered_mask[self_filtered] = pc_filter.vectorized_filter()
+
+        # screen other data of known turbines against their stored bin statistics
+        pwr_low_thresh, pwr_high_thresh = power_thresholds(pwr_bin_mean, pwr_bin_std, self.z_coeff)
+        self.update_turbine_max_power(new_data)
+        known = threshold_mask(turbine_codes, bin_codes, windspeed, power, known & ~sparse_bin,
+                               self.turbine_max_power[turbine_codes],
+                               [(pwr_low_thresh, pwr_high_thresh)], self.cut_in_speed)
+
+        normal_mask = known | (self_filtered_mask & (new_turbine | sparse_bin))
+        updated_codes = np.unique(turbine_codes[normal_mask])
+
+        # forget part of the history of updated turbines before adding their new data
+        self.bin_stats[:, updated_codes] *= 1 - forgetting_factor
+        add_bin_stats(self.bin_stats, turbine_codes, bin_codes, windspeed, power, normal_mask)
+
+        updated_turbines = self.bin_turbine_index[updated_codes]
+        self.build_curves_from_stats(updated_turbines)
+
+        # refresh only the updated rows of compiled wind speed grids
+        if self.power_grid is not None and updated_turbines.isin(self.grid_turbine_index).all():
+            for turbine_name in updated_turbines:
+                self.power_grid[self.grid_turbine_index.get_loc(turbine_name)] = np.clip(
+                    self.pred_funcs_dict[turbine_name](self.windspeed_grid), 0, self.max_power_dict[turbine_name])
+        else:
+            self.power_grid = None
+
+        return self
         
        
-    def predict(self, test_data):
+    def fit_chunks(self, chunks):
+        """
+        Method to create models from training data that is read in chunks, for datasets that do not fit in memory.
+        Filtering makes several passes over the chunks, and only per-(turbine, bin) sufficient statistics
+        (count, sum and sum of squares) are kept. The binned curves use the mean wind speed of each bin
+        since the median cannot be merged across chunks, and normal_df is not stored.
+
+        chunks:          Callable returning an iterator of dataframes, e.g. lambda: pd.read_csv(path, chunksize=100000),
+                         or a re-iterable collection of dataframes
+        """
+        if self.method == 'autoML':
+            print('AutoML method requires the training data in memory (fit). Hence, reverting to binning method')
+
+        pc_filter = PowerCurveFiltering(self.turbine_label, self.windspeed_label, self.power_label,
+                                        None, self.cut_in_speed, self.bin_interval, self.z_coeff, self.filter_cycle,
+                                        profiler=self.profiler)
+        pc_filter.fit_chunks(chunks)
+
+        # final pass: statistics of normal operation data
+        n_turbines = len(pc_filter.chunk_turbine_index)
+        self.bin_stats = empty_bin_stats(n_turbines, pc_filter.chunk_thresholds[0][0].shape[1])
+        max_windspeed = np.full(n_turbines, np.nan)
+        for chunk in iter_chunks(chunks):
+            turbine_codes, bin_codes, windspeed, power = pc_filter.chunk_arrays(chunk)
+            normal_mask = pc_filter.chunk_filter_mask(turbine_codes, bin_codes, windspeed, power)
+
+            add_bin_stats(self.bin_stats, turbine_codes, bin_codes, windspeed, power, normal_mask)
+            max_windspeed = np.fmax(max_windspeed, group_max(windspeed, turbine_codes, normal_mask, n_turbines))
+
+        # binned curves only extend up to the maximum wind speed of the normal data
+        truncate_bin_stats(self.bin_stats, max_windspeed)
+        self.bin_turbine_index = pc_filter.chunk_turbine_index
+        self.turbine_max_power = pc_filter.chunk_max_power
+
+        self.normal_df = None
+        self.condition_funcs_dict = dict()
+        self.pred_funcs_dict = dict()
+        self.max_power_dict = dict()
+        self.power_grid = None
+        self.automl_model = None
+
+        self.build_curves_from_stats(self.bin_turbine_index)
+
+        return self
+
+    def build_curves_from_stats(self, turbine_names):
+        """
+        Creates the interpolation functions and maximum power of the given turbines from bin_stats
+        """
+        count, windspeed_mean, pwr_mean, _ = summarize_bin_stats(self.bin_stats)
+
+        for turbine_name in turbine_names:
+            turbine_code = self.bin_turbine_index.get_loc(turbine_name)
+            occupied = count[turbine_code] > 0
+            if not occupied.any():
+                continue
+
+            self.pred_funcs_dict[turbine_name] = interp1d(windspeed_mean[turbine_code, occupied],
+                                                          pwr_mean[turbine_code, occupied],
+                                                          kind=self.kind, fill_value="extrapolate")
+            self.max_power_dict[turbine_name] = pwr_mean[turbine_code, occupied].round().max()
+
+        self.turbine_names = np.array(list(self.pred_funcs_dict))
+
+    def compile(self, grid_step=0.01, max_windspeed=40):
+        """
+        Evaluates the fitted power curves on a dense wind speed grid for fast prediction.
+        The grid of every turbine is stored as one row of a 2-D array with clipping already applied.
+
+        grid_step:       Wind speed resolution of the grid
+        max_windspeed:   Upper limit of the grid. Wind speeds beyond the grid use the value at its edge
+        """
+        self.windspeed_grid = np.arange(0, max_windspeed + grid_step/2, grid_step)
+        self.grid_turbine_index = pd.Index(list(self.pred_funcs_dict))
+        self.power_grid = np.vstack([np.clip(self.pred_funcs_dict[turbine_name](self.windspeed_grid),
+                                             0, self.max_power_dict[turbine_name])
+                                     for turbine_name in self.grid_turbine_index])
+
+        return self
+
+    def predict(self, test_data, compiled=False, return_series=False):
         """
         Returns the same data as input with an additional expected power column
+
+        compiled:        If true, expected power of all rows is interpolated at once from the
+                         wind speed grids built by compile (called automatically if needed).
+                         Models fitted with the autoML method always score all rows at once.
+        return_series:   If true, returns only the expected power series aligned with test_data
+                         instead of a copy of test_data
         """
+        if compiled or self.automl_model is not None:
+            expected_power = pd.Series(self.compiled_predict(test_data) if self.automl_model is None
+                                       else self.automl_predict(test_data), index=test_data.index,
+                                       name='expected_power')
+            if return_series:
+                return expected_power
+
+            self.pred_df = test_data.copy()
+            self.pred_df['expected_power'] = expected_power
+
+            return self.pred_df
+
         self.pred_df = test_data.copy()
         for turbine_name in self.turbine_names:
             test_temp_df = self.pred_df[self.pred_df[self.turbine_label] == turbine_name]
             test_temp_index = test_temp_df.index
             self.pred_df.loc[test_temp_index, 'expected_power'] = self.pred_funcs_dict[turbine_name](test_temp_df[self.windspeed_label])
+
+            if getattr(self, 'condition_funcs_dict', None):
+                # data in an occupied condition bin uses the curve of that bin
+                condition_codes, valid = condition_bin_codes(test_temp_df, self.condition_bins)
+                for condition_key, condition_ind in test_temp_df[valid].groupby(
+                        [codes[valid] for codes in condition_codes]).indices.items():
+                    f = self.condition_funcs_dict.get((turbine_name,) + (condition_key if isinstance(condition_key, tuple)
+                                                                         else (condition_key,)))
+                    if f is not None:
+                        condition_index = test_temp_index[valid][condition_ind]
+                        self.pred_df.loc[condition_index, 'expected_power'] = f(self.pred_df.loc[condition_index,
+                                                                                                 self.windspeed_label])
             
             # post process expected power estimations to not exceed maximum value in training data
             self.pred_df.loc[test_temp_index, 'expected_power'] = self.pred_df.loc[test_temp_index,
                                                                                    'expected_power'].clip(upper=self.max_power_dict[turbine_name])
 
         self.pred_df['expected_power'].clip(0, inplace=True)
+
+        if return_series:
+            return self.pred_df['expected_power']
          
         return self.pred_df
 
+    def predict_iter(self, chunks, compiled=False, return_series=False):
+        """
+        Estimates expected power of test data read in chunks, holding a single chunk at a time
+
+        chunks:          Iterable of dataframes, e.g. pd.read_csv(path, chunksize=100000),
+                         or a callable returning one
+        Returns: Iterator of the predict results of every chunk
+        """
+        for chunk in (chunks() if callable(chunks) else chunks):
+            yield self.predict(chunk, compiled=compiled, return_series=return_series)
+
+    def iter_energy_losses(self, chunks, timestamp_label, freq='D', interval_hours=1/6, compiled=True):
+        """
+        Folds actual and expected energy of test data read in chunks into per-(turbine, period) sums.
+        Data has to be ordered by time: the sums of a period are emitted once a chunk reaches a later period,
+        so memory does not grow with the length of the data.
+
+        chunks:          Iterable of dataframes, e.g. pd.read_csv(path, chunksize=100000),
+                         or a callable returning one
+        timestamp_label: Column name of timestamps
+        freq:            Pandas period frequency of the sums, e.g. 'D' for days or 'M' for months
+        interval_hours:  Duration of one scada record in hours, 1/6 for 10-minute averages
+        compiled:        If true, expected power is interpolated from compiled wind speed grids
+
+        Returns: Iterator of dataframes with the turbine, period, number of records, actual energy, expected energy,
+                 lost energy (expected - actual) and performance ratio (actual/expected) of completed periods.
+                 Records without expected or actual power are left out.
+        """
+        energy_sums = None
+        for chunk in (chunks() if callable(chunks) else chunks):
+            expected_power = self.predict(chunk, compiled=compiled, return_series=True).to_numpy(dtype=float)
+            power = chunk[self.power_label].to_numpy(dtype=float)
+            period = timestamp_periods(chunk[timestamp_label], freq)
+            valid = ~(np.isnan(expected_power) | np.isnan(power)) & period.notna().to_numpy()
+
+            chunk_sums = pd.DataFrame({self.turbine_label: chunk[self.turbine_label].to_numpy()[valid],
+                                       'period': period[valid].to_numpy(), 'n_records': 1,
+                                       'actual_energy': power[valid]*interval_hours,
+                                       'expected_energy': expected_power[valid]*interval_hours})
+            chunk_sums = chunk_sums.groupby([self.turbine_label, 'period'], sort=False).sum()
+            energy_sums = chunk_sums if energy_sums is None else energy_sums.add(chunk_sums, fill_value=0)
+
+            if valid.any():
+                closed = energy_sums.index.get_level_values('period') < period[valid].max()
+                if closed.any():
+                    yield _energy_loss_frame(energy_sums[closed])
+                    energy_sums = energy_sums[~closed]
+
+        if energy_sums is not None and len(energy_sums):
+            yield _energy_loss_frame(energy_sums)
+
+    def energy_losses(self, chunks, timestamp_label, freq='D', interval_hours=1/6, compiled=True):
+        """
+        Returns: Dataframe of actual, expected and lost energy and performance ratio per turbine and period
+                 of test data read in chunks, as computed by iter_energy_losses. Data out of time order is merged
+                 into the sums of its period.
+        """
+        loss_frames = list(self.iter_energy_losses(chunks, timestamp_label, freq, interval_hours, compiled))
+        if not loss_frames:
+            return _energy_loss_frame(pd.DataFrame(columns=['n_records', 'actual_energy', 'expected_energy'],
+                                                   index=pd.MultiIndex.from_arrays([[], []],
+                                                                                   names=[self.turbine_label, 'period'])))
+
+        energy_sums = pd.concat(loss_frames).groupby([self.turbine_label, 'period'], sort=False)[
+            ['n_records', 'actual_energy', 'expected_energy']].sum()
+
+        return _energy_loss_frame(energy_sums)
+
+    def compiled_predict(self, test_data):
+        """
+        Returns a numpy array of expected power for every row of test_data, computed with a single
+        gather and linear interpolation on the compiled wind speed grids.
+        Rows of turbines missing from the training data get NaN.
+        """
+        if self.power_grid is None:
+            self.compile()
+
+        turbine_codes = self.grid_turbine_index.get_indexer(test_data[self.turbine_label])
+        windspeed = test_data[self.windspeed_label].to_numpy(dtype=float)
+
+        n_grid = len(self.windspeed_grid)
+        grid_step = self.windspeed_grid[1] - self.windspeed_grid[0]
+        position = np.clip(np.nan_to_num(windspeed)/grid_step, 0, n_grid - 1)
+        lower = np.minimum(position.astype(np.int64), n_grid - 2)
+        weight = position - lower
+
+        flat_grid = self.power_grid.ravel()
+        flat_lower = np.maximum(turbine_codes, 0)*n_grid + lower
+        expected_power = flat_grid[flat_lower]*(1 - weight) + flat_grid[flat_lower + 1]*weight
+
+        expected_power[(turbine_codes < 0) | np.isnan(windspeed)] = np.nan
+
+        return expected_power
+
+    def save(self, path):
+        """
+        Writes the fitted model to a directory holding the per-turbine bin arrays as .npy files
+        and the settings, interpolation kind and clip limits as json, plus the LightGBM model of the
+        autoML method as text. Training data is not saved.
+
+        path:            Directory of the saved model, created if it does not exist
+        """
+        os.makedirs(path, exist_ok=True)
+
+        curve_turbine_names = list(self.pred_funcs_dict)
+        count, _, _, pwr_std = summarize_bin_stats(self.bin_stats)
+
+        curve_list = []
+        for turbine_code, turbine_name in enumerate(curve_turbine_names):
+            f = self.pred_funcs_dict[turbine_name]
+            curve = np.zeros(len(f.x), dtype=CURVE_DTYPE)
+            curve['turbine'] = turbine_code
+            curve['windspeed_bin'] = f.x
+            curve['pwr_bin_mean'] = f.y
+
+            # standard deviation and count of the bin containing each knot of the curve
+            bin_code = windspeed_bin_codes(f.x, self.bin_interval)
+            stats_code = self.bin_turbine_index.get_loc(turbine_name)
+            inside = (bin_code >= 0) & (bin_code < self.bin_stats.shape[2])
+            curve['pwr_bin_std'][inside] = np.nan_to_num(pwr_std[stats_code, bin_code[inside]])
+            curve['count'][inside] = count[stats_code, bin_code[inside]]
+            curve_list.append(curve)
+
+        np.save(os.path.join(path, 'curves.npy'), np.concatenate(curve_list) if curve_list else np.zeros(0, dtype=CURVE_DTYPE))
+        np.save(os.path.join(path, 'bin_stats.npy'), self.bin_stats)
+
+        metadata = dict(turbine_label=self.turbine_label, windspeed_label=self.windspeed_label,
+                        power_label=self.power_label, method=self.method, kind=self.kind,
+                        cut_in_speed=self.cut_in_speed, bin_interval=self.bin_interval, z_coeff=self.z_coeff,
+                        filter_cycle=self.filter_cycle, engine=self.engine, binning=self.binning,
+                        condition_bins=self.condition_bins, automl_features=self.automl_features,
+                        automl_params=self.automl_params,
+                        turbine_names=[_json_value(name) for name in curve_turbine_names],
+                        max_power=[_json_value(self.max_power_dict[name]) for name in curve_turbine_names],
+                        bin_turbine_names=[_json_value(name) for name in self.bin_turbine_index],
+                        turbine_max_power=[_json_value(value) for value in self.turbine_max_power])
+        if self.automl_model is not None:
+            metadata['automl_turbine_names'] = [_json_value(name) for name in self.automl_turbine_index]
+            self.automl_model.save_model(os.path.join(path, 'automl_model.txt'))
+
+        with open(os.path.join(path, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Returns a model saved with save, ready for predict and partial_fit
+
+        path:            Directory of the saved model
+        mmap_mode:       Memory-map mode of the bin arrays, so several processes can share one model file.
+                         None reads the arrays into memory.
+        """
+        with open(os.path.join(path, 'metadata.json')) as f:
+            metadata = json.load(f)
+
+        turbine_names = metadata.pop('turbine_names')
+        max_power = metadata.pop('max_power')
+        bin_turbine_names = metadata.pop('bin_turbine_names')
+        turbine_max_power = metadata.pop('turbine_max_power', None)
+        automl_turbine_names = metadata.pop('automl_turbine_names', None)
+
+        power_model = cls(**metadata)
+        power_model.normal_df = None
+        power_model.power_grid = None
+        power_model.bin_stats = np.load(os.path.join(path, 'bin_stats.npy'), mmap_mode=mmap_mode)
+        power_model.bin_turbine_index = pd.Index(bin_turbine_names)
+        # models saved without the raw maximum power fall back to the maximum binned power
+        power_model.turbine_max_power = np.array(turbine_max_power if turbine_max_power is not None else
+                                                 [dict(zip(turbine_names, max_power)).get(name, np.nan)
+                                                  for name in bin_turbine_names], dtype=float)
+
+        curves = np.load(os.path.join(path, 'curves.npy'), mmap_mode=mmap_mode)
+        curve_bounds = np.searchsorted(curves['turbine'], np.arange(len(turbine_names) + 1))
+
+        power_model.pred_funcs_dict = dict()
+        power_model.max_power_dict = dict(zip(turbine_names, max_power))
+        for turbine_code, turbine_name in enumerate(turbine_names):
+            curve = curves[curve_bounds[turbine_code]:curve_bounds[turbine_code + 1]]
+            power_model.pred_funcs_dict[turbine_name] = interp1d(curve['windspeed_bin'], curve['pwr_bin_mean'],
+                                                                 kind=power_model.kind, fill_value="extrapolate",
+                                                                 copy=False, assume_sorted=True)
+        power_model.turbine_names = np.array(turbine_names)
+
+        if automl_turbine_names is not None:
+            import lightgbm as lgb
+
+            power_model.automl_turbine_index = pd.Index(automl_turbine_names)
+            power_model.automl_model = lgb.Booster(model_file=os.path.join(path, 'automl_model.txt'))
+
+        return power_model
+
+
+def timestamp_periods(timestamp, freq):
+    """
+    Returns: Periods of the given frequency of a timestamp series, following the local wall time of
+             timezone-aware timestamps
+    """
+    timestamp = pd.to_datetime(timestamp)
+    if timestamp.dt.tz is not None:
+        timestamp = timestamp.dt.tz_localize(None)
+
+    return timestamp.dt.to_period(freq)
+
+
+def _energy_loss_frame(energy_sums):
+    """
+    Returns: Dataframe of per-(turbine, period) energy sums with lost energy and performance ratio
+    """
+    energy_df = energy_sums.reset_index().sort_values(['period', energy_sums.index.names[0]], ignore_index=True)
+    energy_df['n_records'] = energy_df['n_records'].astype(np.int64)
+    energy_df['lost_energy'] = energy_df['expected_energy'] - energy_df['actual_energy']
+    energy_df['performance_ratio'] = energy_df['actual_energy']/energy_df['expected_energy'].where(
+        energy_df['expected_energy'] > 0)
+
+    return energy_df
+
+
+def _json_value(value):
+    """
+    Converts numpy scalars to the matching python type for json
+    """
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _fit_turbine_curve(normal_temp_df, windspeed_label, power_label, bin_interval, kind, binning='interval'):
+    """
+    Creates the interpolation function of a single turbine from its filtered data
+    Returns: Interpolation function and maximum binned power
+    """
+    # bin filtered data before interpolation
+    if binning == 'sparse':
+        binned_df = sparse_binning_func(normal_temp_df, windspeed_label, power_label, bin_interval)
+    else:
+        binned_df = binning_func(normal_temp_df, windspeed_label, power_label, bin_interval)
+    # create turbine-level interpolation function for estimating expected power
+    f = interp1d(binned_df.windspeed_bin_median, binned_df.pwr_bin_mean, kind=kind, fill_value="extrapolate")
+
+    return f, binned_df.pwr_bin_mean.round().max()
+
+
+def _fit_turbine(turbine_df, filter_params, curve_params, trace_memory=None):
+    """
+    Worker function that filters and fits the data of a single turbine
+    trace_memory:    None if stages are not profiled, otherwise the trace_memory setting of the profiler
+    Returns: Normal operation indices, interpolation function, maximum binned power and profiler records
+    """
+    profiler = None if trace_memory is None else StageProfiler(trace_memory)
+    pc_filter = PowerCurveFiltering(data=turbine_df, profiler=profiler, **filter_params)
+    normal_df, _ = pc_filter.process()
+    if normal_df.empty:
+        return [], None, None, [] if profiler is None else profiler.records
+
+    stage_token = pc_filter.begin_stage()
+    f, max_power = _fit_turbine_curve(normal_df, **curve_params)
+    pc_filter.end_stage(stage_token, 'fit_curve', len(normal_df), len(f.x), turbine_df[filter_params['turbine_label']].iloc[0])
+
+    return normal_df.index.tolist(), f, max_power, [] if profiler is None else profiler.records
+
        
 if __name__ == "__main__":
     
     from sklearn.metrics import mean_absolute_error
+    from scada_data_analysis.utils.data_loader import load_scada_data
     
-    train_df = pd.read_csv(r'examples\datasets\training_data.zip')
+    train_df = load_scada_data(os.path.join('examples', 'datasets', 'training_data.zip'),
+                               'Wind_turbine_name', 'Ws_avg', 'P_avg')
     
-    test_df = pd.read_csv(r'examples\datasets\test_data.zip')
+    test_df = load_scada_data(os.path.join('examples', 'datasets', 'test_data.zip'),
+                              'Wind_turbine_name', 'Ws_avg', 'P_avg')
     
     power_model = ExpectedPower(turbine_label='Wind_turbine_name', windspeed_label='Ws_avg',
                                 power_label='P_avg', method='binning', kind='cubic')
@@ -0,0 +1,139 @@
+"""
+This module evaluates many power curve filtering settings on the same scada data in one pass.
+"""
+import sys
+import numpy as np
+import pandas as pd
+
+from scipy.interpolate import interp1d
+
+sys.path.append('')
+
+from scada_data_analysis.utils.vectorized_filter import (windspeed_bin_codes, downtime_mask, fault_mask,
+                                                         iterative_filter, last_bin_codes, group_max)
+
+
+class FilterParameterSweep:
+    """
+    This class returns the retention rate and hold-out prediction error of every combination of
+    z_coeff, filter_cycle and bin_interval. Downtime and fault removal run once, bin codes are computed
+    once per bin_interval, and the result of every filter cycle is recorded on the way to the largest
+    filter_cycle, so a full grid costs about as much as one filtering run per (bin_interval, z_coeff).
+    """
+
+    def __init__(self, turbine_label, windspeed_label, power_label, z_coeffs=(1.5, 2, 2.5, 3),
+                 filter_cycles=(1, 2, 3, 4, 5), bin_intervals=(0.5,), cut_in_speed=3, kind='linear'):
+        """
+        turbine_label:   Column name of unique turbine identifiers or turbine names
+        windspeed_label: Column name of wind speed
+        power_label:     Column name of active power
+        z_coeffs:        Thresholds of standard deviation to evaluate
+        filter_cycles:   Numbers of filter cycles to evaluate, at least 1
+        bin_intervals:   Wind speed bin intervals to evaluate
+        cut_in_speed:    Cut in speed of turbine
+        kind:            Kind of interpolation of the binned curves used for the hold-out error,
+                         as in ExpectedPower: 'linear', 'quadratic' or 'cubic'
+        """
+        self.turbine_label = turbine_label
+        self.windspeed_label = windspeed_label
+        self.power_label = power_label
+        self.z_coeffs = z_coeffs
+        self.filter_cycles = filter_cycles
+        self.bin_intervals = bin_intervals
+        self.cut_in_speed = cut_in_speed
+        self.kind = kind
+
+    def run(self, training_data, holdout_data=None):
+        """
+        Evaluates every parameter combination
+
+        training_data:   Pandas dataframe of scada data to filter
+        holdout_data:    Optional pandas dataframe of scada data used to score the expected power curves
+                         fitted on the filtered training data
+
+        Returns: Pandas dataframe with one row per combination, holding the share and number of training
+                 rows retained and, with hold-out data, the mean absolute and root mean squared error
+        """
+        if min(int(filter_cycle) for filter_cycle in self.filter_cycles) < 1:
+            raise ValueError(f"filter_cycles have to be at least 1, got {list(self.filter_cycles)!r}")
+
+        windspeed = training_data[self.windspeed_label].to_numpy(dtype=float)
+        power = training_data[self.power_label].to_numpy(dtype=float)
+        turbine_codes, turbine_names = pd.factorize(training_data[self.turbine_label])
+        n_turbines = len(turbine_names)
+
+        # shared steps, identical for every parameter combination
+        keep = (turbine_codes >= 0) & ~downtime_mask(windspeed, power, self.cut_in_speed)
+        keep &= ~fault_mask(turbine_codes, windspeed, power, keep, n_turbines, self.cut_in_speed)
+
+        if holdout_data is not None:
+            holdout_codes = pd.Index(turbine_names).get_indexer(holdout_data[self.turbine_label])
+            # hold-out rows are grouped by turbine once and reused for every combination
+            holdout_order = np.argsort(holdout_codes, kind='stable')
+            holdout_bounds = np.searchsorted(holdout_codes[holdout_order], np.arange(n_turbines + 1) - 1, side='right')
+            holdout_windspeed = holdout_data[self.windspeed_label].to_numpy(dtype=float)
+            holdout_power = holdout_data[self.power_label].to_numpy(dtype=float)
+
+        filter_cycles = sorted(set(int(filter_cycle) for filter_cycle in self.filter_cycles))
+        results = []
+
+        for bin_interval in self.bin_intervals:
+            bin_codes = windspeed_bin_codes(windspeed, bin_interval)
+
+            for z_coeff in self.z_coeffs:
+
+                def on_cycle(cycle, cycle_keep):
+                    if cycle not in filter_cycles:
+                        return
+
+                    result = dict(bin_interval=bin_interval, z_coeff=z_coeff, filter_cycle=cycle,
+                                  retention=cycle_keep.sum()/len(cycle_keep), normal_rows=int(cycle_keep.sum()))
+                    if holdout_data is not None:
+                        expected_power = self.predict_holdout(turbine_codes, bin_codes, windspeed, power, cycle_keep,
+                                                              n_turbines, holdout_order, holdout_bounds,
+                                                              holdout_windspeed)
+                        error = (holdout_power - expected_power)[~np.isnan(expected_power)]
+                        result['mae'] = np.abs(error).mean() if len(error) else np.nan
+                        result['rmse'] = np.sqrt((error**2).mean()) if len(error) else np.nan
+                    results.append(result)
+
+                iterative_filter(turbine_codes, bin_codes, windspeed, power, keep, n_turbines,
+                                 self.cut_in_speed, z_coeff, filter_cycles[-1], on_cycle)
+
+        self.results_df = pd.DataFrame(results)
+
+        return self.results_df
+
+    def predict_holdout(self, turbine_codes, bin_codes, windspeed, power, normal_mask, n_turbines,
+                        holdout_order, holdout_bounds, holdout_windspeed):
+        """
+        Fits binned power curves on the normal training rows like ExpectedPower with the binning method
+
+        holdout_order:   Positions of the hold-out rows sorted by turbine code
+        holdout_bounds:  Start of the sorted hold-out rows of every turbine code, plus the end of the last one
+        Returns: Expected power of every hold-out row, NaN for turbines without a curve
+        """
+        # binned curves only extend up to the maximum wind speed of each turbine's normal data
+        max_windspeed = group_max(windspeed, turbine_codes, normal_mask, n_turbines)
+        last_bin = last_bin_codes(max_windspeed)
+        binned = normal_mask & (bin_codes >= 0) & (bin_codes <= last_bin[turbine_codes])
+
+        binned_df = pd.DataFrame({'turbine': turbine_codes[binned], 'windspeed_bin': bin_codes[binned],
+                                  'windspeed': windspeed[binned], 'power': power[binned]})
+        binned_df = binned_df.groupby(['turbine', 'windspeed_bin']).agg(windspeed_bin_median=('windspeed', 'median'),
+                                                                         pwr_bin_mean=('power', 'mean'))
+        binned_df = binned_df.dropna(subset=['pwr_bin_mean']).reset_index()
+
+        expected_power = np.full(len(holdout_windspeed), np.nan)
+        for turbine_code, turbine_bins in binned_df.groupby('turbine'):
+            holdout_rows = holdout_order[holdout_bounds[turbine_code]:holdout_bounds[turbine_code + 1]]
+            try:
+                f = interp1d(turbine_bins['windspeed_bin_median'], turbine_bins['pwr_bin_mean'],
+                             kind=self.kind, fill_value="extrapolate")
+            except ValueError:
+                # too few bins for the requested kind of interpolation
+                continue
+            expected_power[holdout_rows] = np.clip(f(holdout_windspeed[holdout_rows]), 0,
+                                                   turbine_bins['pwr_bin_mean'].round().max())
+
+        return expected_power
@@ -2,14 +2,27 @@
 This module applies iterative filtering to scada data.
 """
 import os
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat, chain
 import matplotlib.pyplot as plt
 
 import sys
 sys.path.append('')
 
 from scada_data_analysis.utils.binning_function import binning_func
+from scada_data_analysis.utils.vectorized_filter import (windspeed_bin_codes, windspeed_bin_count, downtime_mask,
+                                                         fault_mask, iterative_filter, power_thresholds, threshold_mask,
+                                                         last_bin_codes, group_max)
+from scada_data_analysis.utils.bin_statistics import empty_bin_stats, add_bin_stats, summarize_bin_stats, iter_chunks
+from scada_data_analysis.utils.instrumentation import StageProfiler
+from scada_data_analysis.utils.power_curve_plot import render_power_curves
+from scada_data_analysis.utils.sparse_binning import SparseBins, condition_bin_codes
 
+# reason codes returned by PowerCurveFiltering.process(output='codes'),
+# a data point rejected in secondary filter cycle k gets FAULT + k
+NO_TURBINE, NORMAL, DOWNTIME, FAULT = -1, 0, 1, 2
 
 class PowerCurveFiltering:
     """
@@ -17,7 +30,9 @@ class PowerCurveFiltering:
     """
     
     def __init__(self, turbine_label, windspeed_label, power_label, data=None, cut_in_speed=3,
-                 bin_interval=0.5, z_coeff=2, filter_cycle=5, return_fig=False, image_path=None):
+                 bin_interval=0.5, z_coeff=2, filter_cycle=5, return_fig=False, image_path=None,
+                 engine='pandas', n_jobs=1, profiler=None, fig_backend='scatter', binning='interval',
+                 condition_bins=None):
         """
         turbine_label: column name of unique turbine identifier
         windspeed_label: column name of wind speed
@@ -29,6 +44,19 @@ class PowerCurveFiltering:
         filter_cycle: number of times to pass scada data through filter
         return_fig: if true, module returns power curve plot in addition to filtered datasets
         image_path: used only if return_fig is True
+        engine: 'pandas' filters turbine by turbine, 'vectorized' filters all turbines at once
+                using integer wind speed bin codes and boolean masks. Both return the same split.
+        n_jobs: number of worker processes used to filter turbines in parallel, -1 uses all processors.
+                Each worker receives only the columns of a single turbine.
+        profiler: optional StageProfiler recording wall time, rows in, rows out and peak memory of every
+                  stage, turbine and filter cycle
+        fig_backend: 'scatter' plots every data point, 'raster' draws each turbine as one density image
+                     of the wind speed/power plane, rendered in n_jobs worker processes
+        binning: 'interval' bins the pandas engine's data with binning_func in every filter cycle, 'sparse' assigns
+                 bins once and reduces occupied bins only with SparseBins. Both give the same bin statistics.
+        condition_bins: optional dictionary of column name and bin width of variables the bin statistics are
+                        conditioned on in addition to wind speed, e.g. {'Ba_avg': 30} for wind direction sectors.
+                        Requires the 'vectorized' engine or 'sparse' binning, and is not used by fit_chunks.
         """
         self.turbine_label = turbine_label
         self.windspeed_label = windspeed_label
@@ -40,6 +68,12 @@ class PowerCurveFiltering:
         self.filter_cycle = filter_cycle
         self.return_fig = return_fig
         self.image_path = image_path
+        self.engine = engine
+        self.n_jobs = n_jobs
+        self.profiler = profiler
+        self.fig_backend = fig_backend
+        self.binning = binning
+        self.condition_bins = condition_bins
         
     def remove_downtime_events(self):
         """
@@ -58,65 +92,154 @@ class PowerCurveFiltering:
         self.no_dt_per_turbine_df = self.no_dt_per_turbine_df.drop(self.no_dt_per_turbine_df[((self.no_dt_per_turbine_df[self.power_label] < 0.9*max_power) &\
                                                                                              (self.no_dt_per_turbine_df[self.windspeed_label] > 4.5*self.cut_in_speed))].index)
         
-    def process(self):
+    def process(self, output='frames'):
         """
         Runs the different methods and functions that processes the scada data
+
+        output: 'frames' returns the normal and abnormal subsets of data. 'codes' returns a single int8 array
+                aligned with data holding why each data point was rejected: NORMAL (0) for normal operation,
+                DOWNTIME (1), FAULT (2), FAULT + k if rejected in secondary filter cycle k, or NO_TURBINE (-1)
+                if the turbine label is missing. The pandas engine requires a unique index for codes.
         """
-        self.remove_downtime_events()
+        if output not in ['frames', 'codes']:
+            raise ValueError(f"output has to be 'frames' or 'codes', got {output!r}")
+
+        if self.engine not in ['pandas', 'vectorized']:
+            raise ValueError(f"engine has to be 'pandas' or 'vectorized', got {self.engine!r}")
+
+        if self.binning not in ['interval', 'sparse']:
+            raise ValueError(f"binning has to be 'interval' or 'sparse', got {self.binning!r}")
+
+        if self.condition_bins and self.engine == 'pandas' and self.binning == 'interval':
+            raise ValueError("condition_bins requires engine='vectorized' or binning='sparse'")
+
         turbine_names = self.data[self.turbine_label].unique()
+
+        reason_codes = np.zeros(len(self.data), dtype=np.int8) if output == 'codes' else None
+
+        if self.engine == 'vectorized' and self.n_jobs == 1:
+            normal_mask = self.vectorized_filter(reason_codes)
+
+        elif self.n_jobs == 1:
+            stage_token = self.begin_stage()
+            self.remove_downtime_events()
+            self.end_stage(stage_token, 'remove_downtime_events', len(self.data), len(self.no_dt_df))
+
+            filtered_ind_list = []
+            fault_ind_list = []
+            rejected_ind_list = []
+
+            for turbine_name in turbine_names:
+                # rows without a turbine label are left out, fill_reason_codes marks them NO_TURBINE
+                if pd.isna(turbine_name):
+                    continue
+
+                self.no_dt_per_turbine_df = self.no_dt_df[self.no_dt_df[self.turbine_label] == turbine_name]
+
+                # Remove faulty events from remaining non-downtime data
+                stage_token, no_fault_ind = self.begin_stage(), self.no_dt_per_turbine_df.index
+                self.remove_fault_events_per_turbine()
+                self.end_stage(stage_token, 'remove_fault_events_per_turbine', len(no_fault_ind),
+                               len(self.no_dt_per_turbine_df), turbine_name)
+
+                filtered_ind_list.append(self.secondary_filter())
+
+                if reason_codes is not None:
+                    fault_ind_list.append(no_fault_ind.difference(self.no_dt_per_turbine_df.index))
+                    rejected_ind_list.append(self.rejected_ind_per_cycle)
+
+            if reason_codes is not None:
+                self.fill_reason_codes(reason_codes, fault_ind_list, rejected_ind_list)
+
+        else:
+            filtered_ind_list = self.parallel_filter(reason_codes)
+
+        if output == 'codes':
+            if self.return_fig:
+                self.save_figures(self.data[reason_codes == NORMAL], self.data[reason_codes != NORMAL], turbine_names)
+
+            return reason_codes
+
+        if self.engine == 'vectorized' and self.n_jobs == 1:
+            normal_df = self.data[normal_mask]
+
+            abnormal_df = self.data[~normal_mask]
+
+        else:
+            normal_ind_list = list(chain.from_iterable(filtered_ind_list))
+
+            abnormal_ind_list = self.data.index.difference(normal_ind_list, sort=False).tolist()
+
+            assert len(self.data.index.tolist()) == len(normal_ind_list) + len(abnormal_ind_list)
+
+            normal_df = self.data.loc[normal_ind_list]
+
+            abnormal_df = self.data.loc[abnormal_ind_list]
+
+        if self.return_fig:
+            self.save_figures(normal_df, abnormal_df, turbine_names)
+            
+        return normal_df, abnormal_df
+
+    def save_figures(self, normal_df, abnormal_df, turbine_names):
+        """
+        Saves the power curve plot of every turbine, with normal and abnormal data points in different colors
+        """
+        if self.fig_backend == 'raster':
+            render_power_curves(normal_df, abnormal_df, self.turbine_label, self.windspeed_label, self.power_label,
+                                self.image_path, n_jobs=self.n_jobs)
+            return
+
+        self.normal_df = normal_df.copy()
+        self.abnormal_df = abnormal_df.copy()
         
-        filtered_ind_list = []
+        self.normal_df.loc[:, 'Abnormal'] = 'No'
+        self.abnormal_df.loc[:, 'Abnormal'] = 'Yes'
         
-        for turbine_name in turbine_names:
-            self.no_dt_per_turbine_df = self.no_dt_df[self.no_dt_df[self.turbine_label] == turbine_name]
-                                                      
-            # Remove faulty events from remaining non-downtime data
-            self.remove_fault_events_per_turbine()
-            
-            filtered_ind_list.append(self.secondary_filter())
-            
-        normal_ind_list = sum(filtered_ind_list, [])
+        self.processed_data = pd.concat([self.normal_df, self.abnormal_df])
         
-        abnormal_ind_list = list(set(self.data.index.tolist()).difference(set(normal_ind_list)))
+        if not os.path.exists(self.image_path):
+            os.mkdir(self.image_path)
         
-        assert len(self.data.index.tolist()) == len(normal_ind_list) + len(abnormal_ind_list)
+        for turbine_name in turbine_names:
+            turbine_data = self.processed_data[self.processed_data[self.turbine_label] == turbine_name]
 
-        normal_df = self.data.loc[normal_ind_list]
+            plt.figure(figsize=(18,6))
+            plt.scatter(x=self.windspeed_label, y=self.power_label, s=6, data=turbine_data, c=turbine_data['Abnormal'].map({'No':'blue', 'Yes':'orange'}))
+            plt.title(f"Operational power curve for turbine {turbine_name}", fontsize=16)
+            plt.xlabel("Wind Speed", fontsize=14)
+            plt.ylabel("Power", fontsize=14)
+            plt.xticks(fontsize=14)
+            plt.yticks(fontsize=14)
+            fname = os.path.join(self.image_path, f"{turbine_name}_pc.png")
+            plt.savefig(fname)
+            plt.close()
 
-        abnormal_df = self.data.loc[abnormal_ind_list]
-        
-        if self.return_fig:
-            self.normal_df = normal_df.copy()
-            self.abnormal_df = abnormal_df.copy()
-            
-            self.normal_df.loc[:, 'Abnormal'] = 'No'
-            self.abnormal_df.loc[:, 'Abnormal'] = 'Yes'
-            
-            self.processed_data = pd.concat([self.normal_df, self.abnormal_df])
-            
-            if not os.path.exists(self.image_path):
-                os.mkdir(self.image_path)
-            
-            for turbine_name in turbine_names:
-                turbine_data = self.processed_data[self.processed_data[self.turbine_label] == turbine_name]
-
-                plt.figure(figsize=(18,6))
-                plt.scatter(x=self.windspeed_label, y=self.power_label, s=6, data=turbine_data, c=turbine_data['Abnormal'].map({'No':'blue', 'Yes':'orange'}))
-                plt.title(f"Operational power curve for turbine {turbine_name}", fontsize=16)
-                plt.xlabel("Wind Speed", fontsize=14)
-                plt.ylabel("Power", fontsize=14)
-                plt.xticks(fontsize=14)
-                plt.yticks(fontsize=14)
-                fname = fr"{self.image_path}\{turbine_name}_pc.png"
-                plt.savefig(fname)
-            
-        return normal_df, abnormal_df
+    def fill_reason_codes(self, reason_codes, fault_ind_list, rejected_ind_list):
+        """
+        Fills the reason codes of the pandas engine from the indices removed by each step
+
+        fault_ind_list:    indices removed by fault removal, for each turbine
+        rejected_ind_list: indices rejected in every secondary filter cycle, for each turbine
+        """
+        reason_codes[downtime_mask(self.data[self.windspeed_label].to_numpy(dtype=float),
+                                   self.data[self.power_label].to_numpy(dtype=float), self.cut_in_speed)] = DOWNTIME
+        reason_codes[self.data[self.turbine_label].isna().to_numpy()] = NO_TURBINE
+
+        for fault_ind in fault_ind_list:
+            reason_codes[self.data.index.get_indexer(fault_ind)] = FAULT
+
+        for rejected_ind_per_cycle in rejected_ind_list:
+            for cycle, rejected_ind in enumerate(rejected_ind_per_cycle, start=1):
+                reason_codes[self.data.index.get_indexer(rejected_ind)] = FAULT + cycle
 
     def secondary_filter(self):
         """
         Filters the turbine data using provided threshold (z_coeff)
         Returns: Median wind speed, average and standard deviation of produced power for each bin
         """
+        if self.binning == 'sparse':
+            return self.sparse_secondary_filter()
 
         no_dt_per_turbine_df = self.no_dt_per_turbine_df.reset_index().copy()
         
@@ -131,7 +254,10 @@ class PowerCurveFiltering:
             print("Number of iterative steps cannot be less than 1, filter_cycle set to 1!")
             self.filter_cycle = 1
         
-        for _ in range(int(self.filter_cycle)):
+        self.rejected_ind_per_cycle = []
+
+        for cycle in range(1, int(self.filter_cycle) + 1):
+            stage_token, rows_in = self.begin_stage(), len(no_dt_per_turbine_df)
             
             binned_turb_df = binning_func(no_dt_per_turbine_df, self.windspeed_label, self.power_label, self.bin_interval)
             
@@ -146,18 +272,304 @@ class PowerCurveFiltering:
             no_dt_per_turbine_df.loc[:, 'pwr_high_thresh'] = no_dt_per_turbine_df['pwr_bin_mean'] + self.z_coeff*no_dt_per_turbine_df['pwr_bin_std']
             no_dt_per_turbine_df.loc[:, 'pwr_high_thresh'] = no_dt_per_turbine_df['pwr_high_thresh'].apply(lambda x: 0 if x < 0 else x)
 
-            no_dt_per_turbine_df = no_dt_per_turbine_df[(no_dt_per_turbine_df[self.power_label] > no_dt_per_turbine_df.pwr_low_thresh) &\
-                                   (no_dt_per_turbine_df[self.power_label] < no_dt_per_turbine_df.pwr_high_thresh) |\
-                                   (no_dt_per_turbine_df[self.windspeed_label] < self.cut_in_speed)]
+            normal_mask = (no_dt_per_turbine_df[self.power_label] > no_dt_per_turbine_df.pwr_low_thresh) &\
+                          (no_dt_per_turbine_df[self.power_label] < no_dt_per_turbine_df.pwr_high_thresh) |\
+                          (no_dt_per_turbine_df[self.windspeed_label] < self.cut_in_speed)
+
+            self.rejected_ind_per_cycle.append(no_dt_per_turbine_df.loc[~normal_mask, 'index'].to_numpy())
+
+            no_dt_per_turbine_df = no_dt_per_turbine_df[normal_mask]
+
+            if stage_token is not None:
+                turbine_name = no_dt_per_turbine_df[self.turbine_label].iloc[0] if len(no_dt_per_turbine_df) else None
+                self.end_stage(stage_token, 'secondary_filter', rows_in, len(no_dt_per_turbine_df), turbine_name, cycle)
         
         return no_dt_per_turbine_df['index'].tolist()
+
+    def sparse_secondary_filter(self):
+        """
+        Filters the turbine data like secondary_filter, assigning the sparse bins of all data points once.
+        Each cycle only recomputes the mean and standard deviation of power of the occupied bins.
+        Returns: List of normal operation indices
+        """
+        if self.filter_cycle == 0:
+            print("Number of iterative steps cannot be less than 1, filter_cycle set to 1!")
+            self.filter_cycle = 1
+
+        windspeed = self.no_dt_per_turbine_df[self.windspeed_label].to_numpy(dtype=float)
+        power = self.no_dt_per_turbine_df[self.power_label].to_numpy(dtype=float)
+        bin_codes = windspeed_bin_codes(windspeed, self.bin_interval)
+        condition_codes, valid = condition_bin_codes(self.no_dt_per_turbine_df, self.condition_bins)
+        sparse_bins = SparseBins([bin_codes] + condition_codes, valid & (bin_codes >= 0))
+        below_cut_in = windspeed < self.cut_in_speed
+
+        self.rejected_ind_per_cycle = []
+        keep = np.ones(len(windspeed), dtype=bool)
+
+        for cycle in range(1, int(self.filter_cycle) + 1):
+            stage_token, keep_in = self.begin_stage(), keep
+
+            # bins only extend up to the current maximum wind speed, as in binning_func
+            max_windspeed = np.nanmax(windspeed[keep]) if np.isfinite(windspeed[keep]).any() else np.nan
+            binned = keep & (bin_codes <= last_bin_codes(max_windspeed))
+
+            pwr_bin_mean = np.append(sparse_bins.mean(power, binned), np.nan)[sparse_bins.bin_ids]
+            pwr_bin_std = np.append(np.nan_to_num(sparse_bins.std(power, binned)), np.nan)[sparse_bins.bin_ids]
+            pwr_low_thresh, pwr_high_thresh = power_thresholds(pwr_bin_mean, pwr_bin_std, self.z_coeff)
+
+            keep = keep & (((power > pwr_low_thresh) & (power < pwr_high_thresh)) | below_cut_in)
+
+            self.rejected_ind_per_cycle.append(self.no_dt_per_turbine_df.index[keep_in & ~keep].to_numpy())
+
+            if stage_token is not None:
+                turbine_name = self.no_dt_per_turbine_df[self.turbine_label].iloc[0] if keep.any() else None
+                self.end_stage(stage_token, 'secondary_filter', keep_in.sum(), keep.sum(), turbine_name, cycle)
+
+        return self.no_dt_per_turbine_df.index[keep].tolist()
+
+    def parallel_filter(self, reason_codes=None):
+        """
+        Filters each turbine in a separate worker process
+
+        reason_codes: optional int8 array aligned with data, filled with the reason codes of process(output='codes')
+        Returns: List of normal operation indices for each turbine, in order of first appearance in data
+        """
+        turbine_names, turbine_frames = [], []
+        for turbine_name, turbine_df in split_turbines(self.data, self.turbine_label, self.windspeed_label, self.power_label,
+                                                       list(self.condition_bins or {})):
+            turbine_names.append(turbine_name)
+            turbine_frames.append(turbine_df)
+
+        filter_params = dict(turbine_label=self.turbine_label, windspeed_label=self.windspeed_label,
+                             power_label=self.power_label, cut_in_speed=self.cut_in_speed,
+                             bin_interval=self.bin_interval, z_coeff=self.z_coeff,
+                             filter_cycle=self.filter_cycle, engine=self.engine, binning=self.binning,
+                             condition_bins=self.condition_bins)
+        trace_memory = None if self.profiler is None else self.profiler.trace_memory
+
+        n_jobs = None if self.n_jobs == -1 else self.n_jobs
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_filter_turbine, turbine_frames, repeat(filter_params), repeat(trace_memory)))
+
+        if reason_codes is not None:
+            reason_codes[self.data[self.turbine_label].isna().to_numpy()] = NO_TURBINE
+            turbine_positions = self.data.groupby(self.turbine_label, sort=False, observed=True).indices
+
+        filtered_ind_list = []
+        for turbine_name, turbine_df, (turbine_codes, records) in zip(turbine_names, turbine_frames, results):
+            filtered_ind_list.append(turbine_df.index[turbine_codes == NORMAL].tolist())
+            if reason_codes is not None:
+                reason_codes[turbine_positions[turbine_name]] = turbine_codes
+            for record in records:
+                self.profiler.add(record)
+
+        return filtered_ind_list
+
+    def vectorized_filter(self, reason_codes=None):
+        """
+        Runs downtime removal, fault removal and all filter cycles for every turbine at once.
+        Bin codes are computed a single time and each cycle uses a grouped (turbine, bin) mean and
+        standard deviation of power instead of per-turbine merges.
+
+        reason_codes: optional int8 array aligned with data, filled with the reason codes of process(output='codes')
+        Returns: Boolean array aligned with data, True for data points of normal operation
+        """
+        if self.filter_cycle == 0:
+            print("Number of iterative steps cannot be less than 1, filter_cycle set to 1!")
+            self.filter_cycle = 1
+
+        windspeed = self.data[self.windspeed_label].to_numpy(dtype=float)
+        power = self.data[self.power_label].to_numpy(dtype=float)
+        turbine_codes, turbine_names = pd.factorize(self.data[self.turbine_label])
+
+        stage_token = self.begin_stage()
+        keep = (turbine_codes >= 0) & ~downtime_mask(windspeed, power, self.cut_in_speed)
+        self.end_stage(stage_token, 'remove_downtime_events', len(keep), keep.sum())
+
+        stage_token, keep_in = self.begin_stage(), keep
+        keep = keep & ~fault_mask(turbine_codes, windspeed, power, keep, len(turbine_names), self.cut_in_speed)
+        self.end_stage(stage_token, 'remove_fault_events_per_turbine', keep_in.sum(), keep.sum())
+        self.record_turbine_rows('remove_fault_events_per_turbine', keep_in, keep, turbine_codes, turbine_names)
+
+        if reason_codes is not None:
+            reason_codes[turbine_codes < 0] = NO_TURBINE
+            reason_codes[(turbine_codes >= 0) & ~keep_in] = DOWNTIME
+            reason_codes[keep_in & ~keep] = FAULT
+
+        bin_codes = windspeed_bin_codes(windspeed, self.bin_interval)
+
+        on_cycle = None
+        if self.profiler is not None or reason_codes is not None:
+            cycle_state = dict(token=self.begin_stage(), keep=keep)
+
+            def on_cycle(cycle, cycle_keep):
+                self.end_stage(cycle_state['token'], 'secondary_filter', cycle_state['keep'].sum(), cycle_keep.sum(),
+                               cycle=cycle)
+                self.record_turbine_rows('secondary_filter', cycle_state['keep'], cycle_keep, turbine_codes,
+                                         turbine_names, cycle)
+                if reason_codes is not None:
+                    reason_codes[cycle_state['keep'] & ~cycle_keep] = FAULT + cycle
+                # no stage is left open after the last cycle
+                cycle_state.update(token=self.begin_stage() if cycle < self.filter_cycle else None, keep=cycle_keep)
+
+        condition_codes = None
+        if self.condition_bins:
+            codes, valid = condition_bin_codes(self.data, self.condition_bins)
+            condition_codes = SparseBins(codes, valid).bin_ids
+
+        return iterative_filter(turbine_codes, bin_codes, windspeed, power, keep, len(turbine_names),
+                                self.cut_in_speed, self.z_coeff, self.filter_cycle, on_cycle, condition_codes)
+
+    def begin_stage(self):
+        """
+        Starts profiling a stage if a profiler is set
+        Returns: Token to pass to end_stage, None without profiler
+        """
+        return None if self.profiler is None else self.profiler.begin()
+
+    def end_stage(self, stage_token, stage, rows_in, rows_out, turbine=None, cycle=None):
+        """
+        Stores the profiler record of a stage started with begin_stage
+        """
+        if stage_token is not None:
+            self.profiler.end(stage_token, stage, rows_in, rows_out, turbine, cycle)
+
+    def record_turbine_rows(self, stage, keep_in, keep_out, turbine_codes, turbine_names, cycle=None):
+        """
+        Stores profiler records with the rows in and out of every turbine for a stage that ran on all
+        turbines at once. Wall time and memory of such stages are only recorded for the whole fleet.
+        """
+        if self.profiler is None:
+            return
+
+        rows_in = np.bincount(turbine_codes[keep_in], minlength=len(turbine_names))
+        rows_out = np.bincount(turbine_codes[keep_out], minlength=len(turbine_names))
+        for turbine_name, turbine_rows_in, turbine_rows_out in zip(turbine_names, rows_in, rows_out):
+            self.profiler.add(dict(stage=stage, turbine=turbine_name, cycle=cycle, rows_in=int(turbine_rows_in),
+                                   rows_out=int(turbine_rows_out), wall_time_s=None, peak_memory_mb=None))
+    
+    def fit_chunks(self, chunks):
+        """
+        Learns the filter thresholds from scada data read in chunks, making one pass over the chunks
+        for the maximum power of each turbine and one pass per filter cycle. Only per-(turbine, bin)
+        count, sum and sum of squares tables are kept, so memory does not grow with the size of the data.
+
+        chunks: callable returning an iterator of dataframes, e.g. lambda: pd.read_csv(path, chunksize=100000),
+                or a re-iterable collection of dataframes
+        """
+        if self.filter_cycle == 0:
+            print("Number of iterative steps cannot be less than 1, filter_cycle set to 1!")
+            self.filter_cycle = 1
+
+        # first pass: turbine names, largest wind speed and maximum power of non-downtime data per turbine
+        max_power = pd.Series(dtype=float)
+        max_windspeed = 0
+        for chunk in iter_chunks(chunks):
+            windspeed = chunk[self.windspeed_label].to_numpy(dtype=float)
+            power = chunk[self.power_label].to_numpy(dtype=float)
+            if np.isfinite(windspeed).any():
+                max_windspeed = max(max_windspeed, np.nanmax(windspeed))
+
+            no_dt_chunk = chunk[~downtime_mask(windspeed, power, self.cut_in_speed)]
+            chunk_max_power = no_dt_chunk.groupby(self.turbine_label, sort=False, observed=True)[self.power_label].max()
+            max_power = pd.concat([max_power, chunk_max_power]).groupby(level=0, sort=False).max()
+
+        self.chunk_turbine_index = pd.Index(max_power.index)
+        self.chunk_max_power = max_power.to_numpy(dtype=float)
+        self.chunk_max_windspeed = max_windspeed
+        self.chunk_thresholds = []
+
+        n_turbines, n_bins = len(self.chunk_turbine_index), windspeed_bin_count(max_windspeed)
+        for cycle in range(1, int(self.filter_cycle) + 1):
+            bin_stats = empty_bin_stats(n_turbines, n_bins)
+            cycle_max_windspeed = np.full(n_turbines, np.nan)
+            stage_token, rows_in, rows_out = self.begin_stage(), 0, 0
+
+            for chunk in iter_chunks(chunks):
+                turbine_codes, bin_codes, windspeed, power = self.chunk_arrays(chunk)
+                keep = self.chunk_filter_mask(turbine_codes, bin_codes, windspeed, power)
+                rows_in, rows_out = rows_in + len(chunk), rows_out + keep.sum()
+
+                add_bin_stats(bin_stats, turbine_codes, bin_codes, windspeed, power, keep)
+                cycle_max_windspeed = np.fmax(cycle_max_windspeed, group_max(windspeed, turbine_codes, keep, n_turbines))
+
+            # a turbine's bins only extend up to its current maximum wind speed
+            _, _, pwr_bin_mean, pwr_bin_std = summarize_bin_stats(bin_stats)
+            last_bin = last_bin_codes(cycle_max_windspeed)
+            outside = np.arange(n_bins)[np.newaxis, :] > last_bin[:, np.newaxis]
+            pwr_bin_mean[outside] = np.nan
+
+            self.chunk_thresholds.append(power_thresholds(pwr_bin_mean, pwr_bin_std, self.z_coeff))
+            self.end_stage(stage_token, 'fit_chunks', rows_in, rows_out, cycle=cycle)
+
+        return self
+
+    def chunk_arrays(self, chunk):
+        """
+        Returns: Turbine codes, wind speed bin codes, wind speed and power arrays of a chunk of scada data,
+                 using the turbines and bins learnt by fit_chunks
+        """
+        turbine_codes = self.chunk_turbine_index.get_indexer(chunk[self.turbine_label])
+        windspeed = chunk[self.windspeed_label].to_numpy(dtype=float)
+        power = chunk[self.power_label].to_numpy(dtype=float)
+        bin_codes = windspeed_bin_codes(windspeed, self.bin_interval, self.chunk_max_windspeed)
+
+        return turbine_codes, bin_codes, windspeed, power
+
+    def chunk_filter_mask(self, turbine_codes, bin_codes, windspeed, power):
+        """
+        Returns: Boolean array that is True for data points of a chunk that pass downtime removal,
+                 fault removal and every filter cycle learnt so far by fit_chunks
+        """
+        return threshold_mask(turbine_codes, bin_codes, windspeed, power, turbine_codes >= 0,
+                              self.chunk_max_power[turbine_codes], self.chunk_thresholds, self.cut_in_speed)
+
+    def process_chunks(self, chunks):
+        """
+        Filters scada data read in chunks, learning the filter thresholds first if needed
+        Returns: Iterator of (normal, abnormal) dataframes for every chunk
+        """
+        if not hasattr(self, 'chunk_thresholds'):
+            self.fit_chunks(chunks)
+
+        for chunk in iter_chunks(chunks):
+            normal_mask = self.chunk_filter_mask(*self.chunk_arrays(chunk))
+
+            yield chunk[normal_mask], chunk[~normal_mask]
+
+
+def split_turbines(data, turbine_label, windspeed_label, power_label, extra_columns=()):
+    """
+    Splits scada data into one dataframe per turbine, keeping only the turbine, wind speed and power columns
+    and the given extra columns
+    Returns: Iterator of (turbine name, turbine dataframe) in order of first appearance in data
+    """
+    columns = data[[turbine_label, windspeed_label, power_label] + list(extra_columns)]
+
+    return iter(columns.groupby(turbine_label, sort=False, observed=True))
+
+
+def _filter_turbine(turbine_df, filter_params, trace_memory=None):
+    """
+    Worker function that filters the data of a single turbine
+    trace_memory: None if stages are not profiled, otherwise the trace_memory setting of the profiler
+    Returns: Reason codes aligned with turbine_df and list of profiler records
+    """
+    profiler = None if trace_memory is None else StageProfiler(trace_memory)
+    reason_codes = PowerCurveFiltering(data=turbine_df, profiler=profiler, **filter_params).process(output='codes')
+
+    return reason_codes, [] if profiler is None else profiler.records
+
     
 if __name__ == "__main__":
-    df = pd.read_csv(r'examples\datasets\la-haute-borne-data-2017-2020.zip', sep=';')
+    from scada_data_analysis.utils.data_loader import load_scada_data
+
+    df = load_scada_data(os.path.join('examples', 'datasets', 'la-haute-borne-data-2017-2020.zip'),
+                         'Wind_turbine_name', 'Ws_avg', 'P_avg', 'Date_time', sep=';', utc=True)
     
     pc_filter = PowerCurveFiltering(turbine_label='Wind_turbine_name', windspeed_label='Ws_avg',
                                     power_label='P_avg', data=df, cut_in_speed=3, bin_interval=0.5,
-                                    z_coeff=2.5, filter_cycle=5, return_fig=True, image_path=r'examples\images')
+                                    z_coeff=2.5, filter_cycle=5, return_fig=True, image_path=os.path.join('examples', 'images'))
     normal_df, abnormal_df = pc_filter.process()
     print('Normal Operations Data', normal_df.head())
     print('Abnormal Operations Data', abnormal_df.head())
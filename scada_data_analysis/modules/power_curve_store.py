@@ -0,0 +1,245 @@
+"""
+This module keeps power curve statistics of a fleet over time, to assemble the curves of any time window.
+"""
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.append('')
+
+from scada_data_analysis.utils.bin_statistics import (empty_bin_stats, add_bin_stats, truncate_bin_stats,
+                                                      summarize_bin_stats, COUNT)
+from scada_data_analysis.utils.vectorized_filter import windspeed_bin_codes, downtime_mask, group_max
+from scada_data_analysis.modules.power_curve_preprocessing import PowerCurveFiltering, NORMAL
+from scada_data_analysis.modules.expected_power import ExpectedPower, timestamp_periods
+
+
+class PowerCurveStore:
+    """
+    This class stores per-(turbine, period, wind speed bin) statistics of normal operation data as cumulative
+    sums over periods, so the binned curves and expected power functions of any contiguous range of periods
+    are assembled from two rows of sums per turbine without touching the scada data again.
+    """
+
+    def __init__(self, turbine_label, windspeed_label, power_label, timestamp_label, freq='M', kind='linear',
+                 cut_in_speed=3, bin_interval=0.5, z_coeff=2, filter_cycle=5, engine='vectorized'):
+        """
+        turbine_label:   Column name of unique turbine identifiers or turbine names
+        windspeed_label: Column name of wind speed
+        power_label:     Column name of active power
+        timestamp_label: Column name of timestamps
+        freq:            Pandas period frequency of the stored statistics, e.g. 'D', 'W', 'M' or 'Q'.
+                         Windows are made of whole periods.
+        kind:            Kind of interpolation of the window curves: 'linear', 'quadratic' or 'cubic'
+        cut_in_speed:    Cut in speed of turbine
+        bin_interval:    Wind speed bin interval
+        z_coeff:         Threshold of standard deviation used in filter
+                         within which operational data is considered normal
+        filter_cycle:    Number of times to pass scada data through filter
+        engine:          Power curve filtering engine, 'pandas' or 'vectorized'
+        """
+        self.turbine_label = turbine_label
+        self.windspeed_label = windspeed_label
+        self.power_label = power_label
+        self.timestamp_label = timestamp_label
+        self.freq = freq
+        self.kind = kind
+        self.cut_in_speed = cut_in_speed
+        self.bin_interval = bin_interval
+        self.z_coeff = z_coeff
+        self.filter_cycle = filter_cycle
+        self.engine = engine
+
+        self.turbine_index = pd.Index([])
+        self.periods = pd.PeriodIndex([], freq=freq)
+        self.period_stats = empty_bin_stats(0, 0)[:, :, np.newaxis, :]
+        self.period_max_windspeed = np.empty((0, 0))
+        self.period_max_power = np.empty((0, 0))
+        self.cum_stats = None
+
+    def add(self, data):
+        """
+        Filters scada data and adds its normal operation data to the statistics of its periods.
+        Data is filtered per call, so pass all data of a period at once or in large batches.
+
+        data:            Pandas dataframe of scada data
+        """
+        pc_filter = PowerCurveFiltering(self.turbine_label, self.windspeed_label, self.power_label, data,
+                                        self.cut_in_speed, self.bin_interval, self.z_coeff, self.filter_cycle,
+                                        engine=self.engine)
+        normal_mask = pc_filter.process(output='codes') == NORMAL
+
+        period = timestamp_periods(data[self.timestamp_label], self.freq)
+        normal_mask &= period.notna().to_numpy()
+        if not normal_mask.any():
+            return self
+
+        turbine_labels = data[self.turbine_label]
+        new_turbines = pd.Index(turbine_labels[normal_mask].unique()).difference(self.turbine_index, sort=False)
+        self.turbine_index = self.turbine_index.append(new_turbines)
+
+        windspeed = data[self.windspeed_label].to_numpy(dtype=float)
+        power = data[self.power_label].to_numpy(dtype=float)
+        bin_codes = windspeed_bin_codes(windspeed, self.bin_interval)
+        n_bins = max(int(bin_codes.max()) + 1, self.period_stats.shape[3])
+
+        periods = pd.period_range(min([period[normal_mask].min()] + list(self.periods[:1])),
+                                  max([period[normal_mask].max()] + list(self.periods[-1:])), freq=self.freq)
+        self.resize(periods, n_bins)
+
+        # statistics are added per (turbine, period), flattened into a single code
+        n_periods = len(self.periods)
+        period_codes = self.periods.get_indexer(period.where(normal_mask, self.periods[0]))
+        turbine_period_codes = np.where(normal_mask, self.turbine_index.get_indexer(turbine_labels)*n_periods
+                                        + period_codes, -1)
+
+        stats = self.period_stats.reshape(4, -1, n_bins)
+        add_bin_stats(stats, turbine_period_codes, bin_codes, windspeed, power, normal_mask)
+        max_windspeed = group_max(windspeed, turbine_period_codes, normal_mask, stats.shape[1])
+        self.period_max_windspeed = np.fmax(self.period_max_windspeed, max_windspeed.reshape(-1, n_periods))
+
+        # maximum power of non-downtime data, the fault threshold of partial_fit on window models
+        turbine_codes = self.turbine_index.get_indexer(turbine_labels)
+        all_period_codes = self.periods.get_indexer(period)
+        no_downtime = (turbine_codes >= 0) & (all_period_codes >= 0) & ~downtime_mask(windspeed, power,
+                                                                                          self.cut_in_speed)
+        max_power = group_max(power, turbine_codes*n_periods + all_period_codes, no_downtime, stats.shape[1])
+        self.period_max_power = np.fmax(self.period_max_power, max_power.reshape(-1, n_periods))
+
+        self.cum_stats = None
+
+        return self
+
+    def resize(self, periods, n_bins):
+        """
+        Pads the statistics with empty turbines, periods and bins
+        """
+        period_stats = np.zeros((4, len(self.turbine_index), len(periods), n_bins))
+        period_max_windspeed = np.full((len(self.turbine_index), len(periods)), np.nan)
+        period_max_power = np.full((len(self.turbine_index), len(periods)), np.nan)
+
+        if len(self.periods):
+            offset = periods.get_loc(self.periods[0])
+            old_turbines, old_periods, old_bins = self.period_stats.shape[1:]
+            period_stats[:, :old_turbines, offset:offset + old_periods, :old_bins] = self.period_stats
+            period_max_windspeed[:old_turbines, offset:offset + old_periods] = self.period_max_windspeed
+            period_max_power[:old_turbines, offset:offset + old_periods] = self.period_max_power
+
+        self.periods = periods
+        self.period_stats = period_stats
+        self.period_max_windspeed = period_max_windspeed
+        self.period_max_power = period_max_power
+
+    def window_slice(self, start=None, end=None):
+        """
+        Returns: Positions of the first period and after the last period of a window.
+                 start and end are the first and last periods of the window, both included.
+        """
+        first = 0 if start is None else self.periods.searchsorted(pd.Period(start, self.freq))
+        last = len(self.periods) if end is None else self.periods.searchsorted(pd.Period(end, self.freq), side='right')
+
+        return first, max(first, last)
+
+    def window_stats(self, start=None, end=None):
+        """
+        Returns: Bin statistics array of shape (4, turbines, bins) of the window, truncated beyond the
+                 maximum wind speed of each turbine in the window like the bins of binning_func
+        """
+        if self.cum_stats is None:
+            # cumulative sums with a leading zero period, so a window is the difference of two periods
+            self.cum_stats = np.concatenate([np.zeros(self.period_stats.shape[:2] + (1,) + self.period_stats.shape[3:]),
+                                             np.cumsum(self.period_stats, axis=2)], axis=2)
+
+        first, last = self.window_slice(start, end)
+        bin_stats = self.cum_stats[:, :, last] - self.cum_stats[:, :, first]
+        # counts and sums are rebuilt from differences, so remove rounding residue of empty bins
+        bin_stats[:, bin_stats[COUNT] < 0.5] = 0
+
+        period_max_windspeed = self.period_max_windspeed[:, first:last]
+        max_windspeed = np.where(np.isnan(period_max_windspeed), -np.inf, period_max_windspeed).max(axis=1, initial=-np.inf)
+        max_windspeed[np.isinf(max_windspeed)] = np.nan
+
+        return truncate_bin_stats(bin_stats, max_windspeed)
+
+    def window_curves(self, start=None, end=None):
+        """
+        Returns: Pandas dataframe of the binned curves of a window, with one row per occupied
+                 (turbine, bin) holding the mean wind speed, mean and standard deviation of power and count
+        """
+        count, windspeed_mean, pwr_mean, pwr_std = summarize_bin_stats(self.window_stats(start, end))
+        turbine_codes, bin_codes = np.nonzero(count)
+
+        return pd.DataFrame({self.turbine_label: self.turbine_index[turbine_codes],
+                             'windspeed_bin': windspeed_mean[turbine_codes, bin_codes],
+                             'pwr_bin_mean': pwr_mean[turbine_codes, bin_codes],
+                             'pwr_bin_std': pwr_std[turbine_codes, bin_codes],
+                             'count': count[turbine_codes, bin_codes].astype(np.int64)})
+
+    def window_model(self, start=None, end=None):
+        """
+        Returns: ExpectedPower estimator of a window, built like ExpectedPower.fit_chunks from the mean wind speed
+                 and mean power of every bin, ready for predict, compile and partial_fit
+        """
+        power_model = ExpectedPower(self.turbine_label, self.windspeed_label, self.power_label, method='binning',
+                                    kind=self.kind, cut_in_speed=self.cut_in_speed, bin_interval=self.bin_interval,
+                                    z_coeff=self.z_coeff, filter_cycle=self.filter_cycle, engine=self.engine)
+        power_model.bin_stats = self.window_stats(start, end)
+        power_model.bin_turbine_index = self.turbine_index
+        period_max_power = self.period_max_power[:, slice(*self.window_slice(start, end))]
+        power_model.turbine_max_power = np.where(np.isnan(period_max_power), -np.inf, period_max_power).max(
+            axis=1, initial=-np.inf)
+        power_model.turbine_max_power[np.isinf(power_model.turbine_max_power)] = np.nan
+        power_model.normal_df = None
+        power_model.pred_funcs_dict = dict()
+        power_model.max_power_dict = dict()
+        power_model.power_grid = None
+        power_model.build_curves_from_stats(self.turbine_index)
+
+        return power_model
+
+    def drift(self, reference, window):
+        """
+        Compares the curves of every turbine in a window with its curves in a reference window
+
+        reference:       (start, end) periods of the reference window, None for an open end
+        window:          (start, end) periods of the compared window
+
+        Returns: Pandas dataframe with one row per turbine holding the number of normal data points of both
+                 windows, the number of bins occupied in both, the mean change of bin power in these bins, and the
+                 relative change of power weighted by the data points of the window, e.g. -0.02 for 2% less power
+        """
+        ref_count, _, ref_pwr_mean, _ = summarize_bin_stats(self.window_stats(*reference))
+        window_stats = self.window_stats(*window)
+        count, _, pwr_mean, _ = summarize_bin_stats(window_stats)
+
+        common = (ref_count > 0) & (count > 0)
+        pwr_change = np.where(common, pwr_mean - ref_pwr_mean, 0)
+        n_common = common.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_change = pwr_change.sum(axis=1)/n_common
+            relative_change = ((count*pwr_change).sum(axis=1)/
+                               np.where(common, count*ref_pwr_mean, 0).sum(axis=1))
+
+        return pd.DataFrame({self.turbine_label: self.turbine_index,
+                             'reference_count': ref_count.sum(axis=1).astype(np.int64),
+                             'window_count': count.sum(axis=1).astype(np.int64),
+                             'common_bins': n_common,
+                             'mean_power_change': mean_change,
+                             'relative_power_change': relative_change})
+
+    def drift_over_time(self, reference, window_periods=1):
+        """
+        Compares consecutive windows of window_periods periods with a reference window, e.g. every month or
+        quarter of the stored data with the first year of operation
+
+        Returns: Pandas dataframe of drift results with the first and last period of every window
+        """
+        results = []
+        for first in range(0, len(self.periods), window_periods):
+            start, end = self.periods[first], self.periods[min(first + window_periods, len(self.periods)) - 1]
+            drift_df = self.drift(reference, (start, end))
+            drift_df.insert(1, 'window_start', start)
+            drift_df.insert(2, 'window_end', end)
+            results.append(drift_df)
+
+        return pd.concat(results, ignore_index=True) if results else pd.DataFrame()
@@ -0,0 +1,99 @@
+"""
+These are functions for keeping mergeable per-(turbine, wind speed bin) statistics of scada data
+"""
+
+# Import relevant libraries
+import numpy as np
+
+from scada_data_analysis.utils.vectorized_filter import last_bin_codes
+
+# positions of the sufficient statistics in the first axis of a bin statistics array
+COUNT, WINDSPEED_SUM, POWER_SUM, POWER_SQ_SUM = range(4)
+
+
+def empty_bin_stats(n_turbines, n_bins):
+    """
+    Returns a zero bin statistics array of shape (4, n_turbines, n_bins) holding the count,
+    sum of wind speed, sum of power and sum of squared power of every (turbine, bin)
+    """
+    return np.zeros((4, n_turbines, n_bins))
+
+
+def add_bin_stats(bin_stats, turbine_codes, bin_codes, windspeed, power, keep=None):
+    """
+    Adds the data points in keep to bin_stats in place. Points without a turbine code, a bin code
+    or a power value are skipped, so statistics of separate chunks of data can simply be summed.
+
+    turbine_codes: integer turbine code of every data point, -1 if unknown
+    bin_codes:     wind speed bin code of every data point, -1 if outside every bin
+    """
+    n_turbines, n_bins = bin_stats.shape[1:]
+
+    valid = (turbine_codes >= 0) & (bin_codes >= 0) & (bin_codes < n_bins) & ~np.isnan(power)
+    if keep is not None:
+        valid &= keep
+
+    flat_codes = turbine_codes[valid].astype(np.int64)*n_bins + bin_codes[valid]
+    power = power[valid]
+    for position, weights in [(COUNT, None), (WINDSPEED_SUM, windspeed[valid]),
+                              (POWER_SUM, power), (POWER_SQ_SUM, power**2)]:
+        bin_stats[position] += np.bincount(flat_codes, weights=weights,
+                                           minlength=n_turbines*n_bins).reshape(n_turbines, n_bins)
+
+    return bin_stats
+
+
+def truncate_bin_stats(bin_stats, max_windspeed):
+    """
+    Empties, in place, the bins of every turbine that lie beyond its maximum wind speed, in the same way
+    binning_func only builds bins up to the maximum wind speed of the data
+
+    max_windspeed: array of maximum wind speed per turbine, NaN for turbines without data
+    """
+    last_bin = last_bin_codes(max_windspeed)
+    bin_stats[:, np.arange(bin_stats.shape[2])[np.newaxis, :] > last_bin[:, np.newaxis]] = 0
+
+    return bin_stats
+
+
+def resize_bin_stats(bin_stats, n_turbines, n_bins):
+    """
+    Returns a copy of bin_stats padded with empty turbines and bins up to the given shape
+    """
+    resized = empty_bin_stats(max(n_turbines, bin_stats.shape[1]), max(n_bins, bin_stats.shape[2]))
+    resized[:, :bin_stats.shape[1], :bin_stats.shape[2]] = bin_stats
+
+    return resized
+
+
+def summarize_bin_stats(bin_stats):
+    """
+    Returns: Count, mean wind speed, mean power and standard deviation of power of every (turbine, bin).
+             Empty bins have missing means, bins with a single data point have a standard deviation of 0.
+    """
+    count = bin_stats[COUNT]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        windspeed_mean = bin_stats[WINDSPEED_SUM]/count
+        pwr_mean = bin_stats[POWER_SUM]/count
+        pwr_var = (bin_stats[POWER_SQ_SUM] - bin_stats[POWER_SUM]*pwr_mean)/(count - 1)
+    pwr_std = np.sqrt(np.clip(pwr_var, 0, None))
+    pwr_std[count == 1] = 0
+
+    return count, windspeed_mean, pwr_mean, pwr_std
+
+
+def iter_chunks(chunks):
+    """
+    Returns a fresh iterator over chunks of scada data
+
+    chunks: callable returning an iterator of dataframes, e.g. lambda: pd.read_csv(path, chunksize=100000),
+            or a re-iterable collection of dataframes such as a list
+    """
+    if callable(chunks):
+        return iter(chunks())
+
+    if iter(chunks) is chunks:
+        raise ValueError("chunks are read in several passes, pass a callable returning a new iterator "
+                         "or a re-iterable collection instead of a one-shot iterator")
+
+    return iter(chunks)
@@ -0,0 +1,130 @@
+"""
+These are functions for loading only the scada columns and rows needed for analysis, in compact dtypes
+"""
+
+# Import relevant libraries
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# file extensions read with pyarrow, all other files are read as (optionally compressed) csv
+ARROW_FORMATS = {'.parquet': 'parquet', '.pq': 'parquet', '.arrow': 'ipc', '.feather': 'ipc', '.ipc': 'ipc'}
+
+
+def load_scada_data(path, turbine_label, windspeed_label, power_label, timestamp_label=None, turbines=None,
+                    start=None, end=None, sep=',', chunksize=500000, utc=False):
+    """
+    Reads the turbine, wind speed, power and (optionally) timestamp columns of a csv, zipped csv,
+    Parquet or Arrow file, keeping only the requested turbines and time range while reading.
+    Turbine labels are stored as categoricals and measurements as float32.
+
+    path:            Path of the scada data file
+    turbines:        Optional list of turbine labels to keep
+    start:           Optional first timestamp to keep, requires timestamp_label
+    end:             Optional timestamp before which data is kept, requires timestamp_label
+    sep:             Delimiter of csv files
+    chunksize:       Number of csv rows parsed at a time, which bounds the memory used by unselected rows
+    utc:             If true, timestamps are parsed as UTC, needed for offsets that change e.g. with daylight saving
+
+    Returns: Pandas dataframe ready for PowerCurveFiltering and ExpectedPower
+    """
+    if (start is not None or end is not None) and timestamp_label is None:
+        raise ValueError("timestamp_label is required to filter by start or end")
+
+    if os.path.splitext(str(path))[1].lower() in ARROW_FORMATS:
+        return _load_arrow(path, turbine_label, windspeed_label, power_label, timestamp_label, turbines, start, end)
+
+    chunk_list = list(iter_scada_data(path, turbine_label, windspeed_label, power_label, timestamp_label, turbines,
+                                      start, end, sep, chunksize, utc))
+    if not chunk_list:
+        return _compact(pd.DataFrame(columns=_columns(turbine_label, windspeed_label, power_label, timestamp_label)),
+                        turbine_label, windspeed_label, power_label)
+
+    # categories differ between chunks, so combine them before concatenating
+    turbine_column = union_categoricals([chunk[turbine_label] for chunk in chunk_list])
+    scada_df = pd.concat([chunk.drop(columns=turbine_label) for chunk in chunk_list], ignore_index=True)
+    scada_df.insert(0, turbine_label, turbine_column)
+
+    return scada_df
+
+
+def iter_scada_data(path, turbine_label, windspeed_label, power_label, timestamp_label=None, turbines=None,
+                    start=None, end=None, sep=',', chunksize=500000, utc=False):
+    """
+    Reads a csv or zipped csv file in chunks with the same column, turbine and time range selection
+    as load_scada_data
+    Returns: Iterator of compact pandas dataframes
+    """
+    columns = _columns(turbine_label, windspeed_label, power_label, timestamp_label)
+    dtype = {turbine_label: str, windspeed_label: np.float32, power_label: np.float32}
+
+    for chunk in pd.read_csv(path, sep=sep, usecols=columns, dtype=dtype, chunksize=chunksize):
+        if turbines is not None:
+            chunk = chunk[chunk[turbine_label].isin(turbines)]
+        if timestamp_label is not None:
+            chunk[timestamp_label] = pd.to_datetime(chunk[timestamp_label], utc=utc)
+            chunk = chunk[_time_mask(chunk[timestamp_label], start, end)]
+
+        yield _compact(chunk[columns], turbine_label, windspeed_label, power_label)
+
+
+def scada_chunk_reader(path, turbine_label, windspeed_label, power_label, timestamp_label=None, turbines=None,
+                       start=None, end=None, sep=',', chunksize=500000, utc=False):
+    """
+    Returns: Callable giving a new iterator over the chunks of iter_scada_data on every call,
+             as expected by ExpectedPower.fit_chunks and PowerCurveFiltering.fit_chunks
+    """
+    return lambda: iter_scada_data(path, turbine_label, windspeed_label, power_label, timestamp_label,
+                                   turbines, start, end, sep, chunksize, utc)
+
+
+def _load_arrow(path, turbine_label, windspeed_label, power_label, timestamp_label, turbines, start, end):
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format=ARROW_FORMATS[os.path.splitext(str(path))[1].lower()])
+
+    # predicates are pushed down to the reader, so unselected row groups are skipped
+    row_filter = None
+    if turbines is not None:
+        row_filter = ds.field(turbine_label).isin(list(turbines))
+    if timestamp_label is not None:
+        tz = getattr(dataset.schema.field(timestamp_label).type, 'tz', None)
+        for bound, compare in [(start, lambda field, value: field >= value), (end, lambda field, value: field < value)]:
+            if bound is None:
+                continue
+            condition = compare(ds.field(timestamp_label), _as_timestamp(bound, tz).to_pydatetime())
+            row_filter = condition if row_filter is None else row_filter & condition
+
+    table = dataset.to_table(columns=_columns(turbine_label, windspeed_label, power_label, timestamp_label),
+                             filter=row_filter)
+
+    return _compact(table.to_pandas(), turbine_label, windspeed_label, power_label)
+
+
+def _columns(turbine_label, windspeed_label, power_label, timestamp_label):
+    columns = [turbine_label, windspeed_label, power_label]
+    return columns if timestamp_label is None else columns + [timestamp_label]
+
+
+def _compact(scada_df, turbine_label, windspeed_label, power_label):
+    return scada_df.astype({turbine_label: 'category', windspeed_label: np.float32,
+                            power_label: np.float32}).reset_index(drop=True)
+
+
+def _as_timestamp(value, tz):
+    timestamp = pd.Timestamp(value)
+    if tz is not None and timestamp.tzinfo is None:
+        return timestamp.tz_localize(tz)
+    return timestamp
+
+
+def _time_mask(timestamp, start, end):
+    tz = getattr(timestamp.dt, 'tz', None)
+    mask = np.ones(len(timestamp), dtype=bool)
+    if start is not None:
+        mask &= (timestamp >= _as_timestamp(start, tz)).to_numpy()
+    if end is not None:
+        mask &= (timestamp < _as_timestamp(end, tz)).to_numpy()
+    return mask
@@ -0,0 +1,131 @@
+"""
+This is a class for reusing power curve filtering results across repeated fits on the same scada data
+"""
+
+# Import relevant libraries
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# file name prefix of cached results, so other files in the cache directory are never deleted
+CACHE_FILE_PREFIX = 'filter_codes_'
+
+
+class FilterCache:
+    """
+    Stores the reason codes of PowerCurveFiltering.process(output='codes'), one int8 per data point,
+    under a fingerprint of the turbine, wind speed and power columns and the filtering parameters.
+    Pass an instance as the cache argument of ExpectedPower to filter the training data only once
+    when fitting several kinds of curves.
+    """
+
+    def __init__(self, max_bytes=256*2**20, cache_dir=None, max_disk_bytes=None):
+        """
+        max_bytes:       Size of the in-memory cache, the least recently used results are evicted beyond it
+        cache_dir:       Optional directory keeping results on disk across sessions, created if it does not exist.
+                         Only files named like cached results are evicted or cleared.
+        max_disk_bytes:  Optional size of the on-disk cache, the least recently used files are deleted beyond it
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, data, turbine_label, windspeed_label, power_label, params, extra_columns=()):
+        """
+        Returns: Hex digest identifying the index, turbine, wind speed, power and extra column values of data
+                 and params
+        """
+        columns = [turbine_label, windspeed_label, power_label] + list(extra_columns)
+        row_hashes = pd.util.hash_pandas_object(data[columns], index=True)
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.ascontiguousarray(row_hashes.to_numpy()).tobytes())
+        digest.update(json.dumps(params, sort_keys=True, default=float).encode())
+
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns: Cached reason codes, or None if key is not cached
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        fname = self.disk_path(key)
+        if fname is not None and os.path.exists(fname):
+            reason_codes = np.load(fname)
+            # mark the file as recently used for eviction
+            os.utime(fname)
+            self.store(key, reason_codes)
+            self.hits += 1
+            return reason_codes
+
+        self.misses += 1
+        return None
+
+    def put(self, key, reason_codes):
+        """
+        Stores reason codes in memory and, with a cache directory, on disk
+        """
+        reason_codes = np.asarray(reason_codes, dtype=np.int8)
+        self.store(key, reason_codes)
+
+        fname = self.disk_path(key)
+        if fname is not None:
+            np.save(fname, reason_codes)
+            self.evict_disk()
+
+    def store(self, key, reason_codes):
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key).nbytes
+        self.entries[key] = reason_codes
+        self.nbytes += reason_codes.nbytes
+
+        while self.nbytes > self.max_bytes and self.entries:
+            self.nbytes -= self.entries.popitem(last=False)[1].nbytes
+
+    def disk_path(self, key):
+        return None if self.cache_dir is None else os.path.join(self.cache_dir, f"{CACHE_FILE_PREFIX}{key}.npy")
+
+    def evict_disk(self):
+        if self.max_disk_bytes is None:
+            return
+
+        fnames = [os.path.join(self.cache_dir, fname) for fname in self.cache_files()]
+        fnames.sort(key=os.path.getmtime)
+        disk_bytes = sum(os.path.getsize(fname) for fname in fnames)
+        for fname in fnames:
+            if disk_bytes <= self.max_disk_bytes:
+                break
+            disk_bytes -= os.path.getsize(fname)
+            os.remove(fname)
+
+    def clear(self):
+        """
+        Removes all cached results from memory and disk
+        """
+        self.entries.clear()
+        self.nbytes = 0
+        if self.cache_dir is not None:
+            for fname in self.cache_files():
+                os.remove(os.path.join(self.cache_dir, fname))
+
+    def cache_files(self):
+        """
+        Returns: Names of the files of cached results in the cache directory
+        """
+        return [fname for fname in os.listdir(self.cache_dir)
+                if fname.startswith(CACHE_FILE_PREFIX) and fname.endswith('.npy')]
@@ -0,0 +1,98 @@
+"""
+This is a class for recording wall time, data sizes and peak memory of the stages of the filtering pipeline
+"""
+
+# Import relevant libraries
+import time
+import tracemalloc
+
+import pandas as pd
+
+
+class StageProfiler:
+    """
+    Collects one record per pipeline stage, turbine and filter cycle. Pass an instance as the profiler
+    argument of PowerCurveFiltering or ExpectedPower; nothing is measured when no profiler is given.
+    """
+
+    def __init__(self, trace_memory=False, callback=None):
+        """
+        trace_memory: if true, peak memory allocated during each stage is measured with tracemalloc.
+                      This slows down the pipeline noticeably. The profiler only traces while a stage is open and
+                      never restarts a tracing session it did not start; without tracemalloc.reset_peak
+                      (Python < 3.9), stages running inside such a session get no peak memory.
+        callback:     optional callable receiving every record as a dictionary as soon as it is made,
+                      e.g. to forward it to a monitoring system
+        """
+        self.trace_memory = trace_memory
+        self.callback = callback
+        self.records = []
+        self.open_stages = 0
+        self.started_tracing = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def begin(self):
+        """
+        Starts measuring a stage
+        Returns: Token to pass to end
+        """
+        if not self.trace_memory:
+            return time.perf_counter(), None
+
+        self.open_stages += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        elif hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        elif not self.started_tracing:
+            # the peak of a session started by the caller cannot be reset
+            return time.perf_counter(), None
+
+        return time.perf_counter(), tracemalloc.get_traced_memory()[0]
+
+    def end(self, token, stage, rows_in, rows_out, turbine=None, cycle=None):
+        """
+        Finishes measuring a stage started with begin and stores its record
+        """
+        started, start_memory = token
+        record = dict(stage=stage, turbine=turbine, cycle=cycle, rows_in=int(rows_in), rows_out=int(rows_out),
+                      wall_time_s=time.perf_counter() - started, peak_memory_mb=None)
+        if start_memory is not None:
+            record['peak_memory_mb'] = max(tracemalloc.get_traced_memory()[1] - start_memory, 0)/1e6
+
+        if self.trace_memory:
+            self.open_stages = max(self.open_stages - 1, 0)
+            if self.open_stages == 0:
+                self.stop()
+
+        self.add(record)
+
+    def stop(self):
+        """
+        Stops memory tracing if the profiler started it, e.g. after a run that failed within a stage
+        """
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        self.open_stages = 0
+
+    def add(self, record):
+        """
+        Stores a record, e.g. one made by the profiler of a worker process
+        """
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def to_frame(self):
+        """
+        Returns: Pandas dataframe with one row per record
+        """
+        return pd.DataFrame(self.records, columns=['stage', 'turbine', 'cycle', 'rows_in', 'rows_out',
+                                                   'wall_time_s', 'peak_memory_mb'])
@@ -0,0 +1,118 @@
+"""
+This is a function for rendering power curve plots of many turbines as density images
+"""
+
+# Import relevant libraries
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.colors import to_rgb
+
+NORMAL_COLOR, ABNORMAL_COLOR = to_rgb('blue'), to_rgb('orange')
+
+
+def render_power_curves(normal_df, abnormal_df, turbine_label, windspeed_label, power_label, image_path,
+                        n_jobs=1, bins=(360, 180), figsize=(18, 6), dpi=100):
+    """
+    Saves one power curve image per turbine. Data points are counted on a 2-D wind speed/power grid
+    with numpy and drawn as a single image, colored from blue (normal) to orange (abnormal) with
+    opacity growing with the number of points, so plotting cost does not depend on the number of points.
+
+    normal_df:     pandas dataframe of normal operation data
+    abnormal_df:   pandas dataframe of abnormal operation data
+    image_path:    directory of the images, created if it does not exist
+    n_jobs:        number of worker processes rendering turbines in parallel, -1 uses all processors.
+                   At most two grids per worker are waiting to be rendered at any time.
+    bins:          number of wind speed and power cells of the grid
+
+    Returns: List of paths of the saved images
+    """
+    os.makedirs(image_path, exist_ok=True)
+
+    turbine_labels = pd.concat([normal_df[turbine_label], abnormal_df[turbine_label]], ignore_index=True)
+    turbine_codes, turbine_names = pd.factorize(turbine_labels)
+    windspeed = np.concatenate([normal_df[windspeed_label].to_numpy(dtype=float),
+                                abnormal_df[windspeed_label].to_numpy(dtype=float)])
+    power = np.concatenate([normal_df[power_label].to_numpy(dtype=float),
+                            abnormal_df[power_label].to_numpy(dtype=float)])
+    abnormal = np.repeat([0, 1], [len(normal_df), len(abnormal_df)])
+
+    # group data points by turbine once, then take contiguous slices
+    order = np.argsort(turbine_codes, kind='stable')
+    bounds = np.searchsorted(turbine_codes[order], np.arange(len(turbine_names) + 1) - 1, side='right')
+
+    def turbine_grids():
+        for turbine_code, turbine_name in enumerate(turbine_names):
+            rows = order[bounds[turbine_code]:bounds[turbine_code + 1]]
+            fname = os.path.join(image_path, f"{turbine_name}_pc.png")
+            yield (turbine_name, fname) + density_grid(windspeed[rows], power[rows], abnormal[rows], bins)
+
+    if n_jobs == 1:
+        return [_render_turbine(*args, figsize=figsize, dpi=dpi) for args in turbine_grids()]
+
+    max_workers = os.cpu_count() if n_jobs == -1 else n_jobs
+    fnames, pending = [], []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for args in turbine_grids():
+            pending.append(executor.submit(_render_turbine, *args, figsize=figsize, dpi=dpi))
+            # bound the number of grids held in memory
+            if len(pending) >= 2*max_workers:
+                fnames.append(pending.pop(0).result())
+        fnames.extend(future.result() for future in pending)
+
+    return fnames
+
+
+def density_grid(windspeed, power, abnormal, bins=(360, 180)):
+    """
+    Counts normal and abnormal data points on a 2-D wind speed/power grid
+    Returns: Counts of shape (2, power cells, wind speed cells) and extent of the grid
+    """
+    valid = ~(np.isnan(windspeed) | np.isnan(power))
+    windspeed, power, abnormal = windspeed[valid], power[valid], abnormal[valid]
+    if not len(windspeed):
+        return np.zeros((2, bins[1], bins[0]), dtype=np.int64), (0, 1, 0, 1)
+
+    extent = (min(windspeed.min(), 0), windspeed.max(), power.min(), power.max())
+    windspeed_cell = _cell(windspeed, extent[0], extent[1], bins[0])
+    power_cell = _cell(power, extent[2], extent[3], bins[1])
+
+    counts = np.bincount((abnormal*bins[1] + power_cell)*bins[0] + windspeed_cell, minlength=2*bins[0]*bins[1])
+
+    return counts.reshape(2, bins[1], bins[0]), extent
+
+
+def _cell(values, lower, upper, n_cells):
+    span = upper - lower if upper > lower else 1
+    return np.clip(((values - lower)/span*n_cells).astype(np.int64), 0, n_cells - 1)
+
+
+def _render_turbine(turbine_name, fname, counts, extent, figsize=(18, 6), dpi=100):
+    """
+    Worker function that draws the density grid of a single turbine and saves it
+    Returns: Path of the saved image
+    """
+    total = counts.sum(axis=0)
+    share_abnormal = np.divide(counts[1], total, out=np.zeros(total.shape), where=total > 0)
+
+    image = np.ones(total.shape + (4,))
+    for channel in range(3):
+        image[..., channel] = (1 - share_abnormal)*NORMAL_COLOR[channel] + share_abnormal*ABNORMAL_COLOR[channel]
+    image[..., 3] = np.where(total > 0, 0.25 + 0.75*np.log1p(total)/np.log1p(max(total.max(), 1)), 0)
+
+    fig = Figure(figsize=figsize)
+    ax = fig.add_subplot()
+    ax.imshow(image, origin='lower', extent=extent, aspect='auto', interpolation='nearest')
+    ax.set_title(f"Operational power curve for turbine {turbine_name}", fontsize=16)
+    ax.set_xlabel("Wind Speed", fontsize=14)
+    ax.set_ylabel("Power", fontsize=14)
+    ax.tick_params(labelsize=14)
+    fig.savefig(fname, dpi=dpi)
+
+    # figures made without pyplot are not tracked globally, clearing releases the image right away
+    fig.clf()
+
+    return fname
@@ -0,0 +1,152 @@
+"""
+These are functions for binning scada data on several dimensions, keeping statistics of occupied bins only
+"""
+
+# Import relevant libraries
+import math
+
+import numpy as np
+import pandas as pd
+
+from scada_data_analysis.utils.vectorized_filter import windspeed_bin_codes, last_bin_codes
+
+
+class SparseBins:
+    """
+    Maps every data point to an occupied bin of a multi-dimensional grid of integer bin codes. The codes
+    are packed into a single integer key and sorted once, so memory grows with the number of occupied bins
+    instead of the size of the grid, and statistics are computed with vectorized reductions over bin ids.
+    """
+
+    def __init__(self, codes, valid=None):
+        """
+        codes:  List of integer bin code arrays, one per dimension, all of the same length
+        valid:  Optional boolean array of data points that belong to a bin, e.g. excluding missing values
+        """
+        codes = [np.asarray(dimension_codes, dtype=np.int64) for dimension_codes in codes]
+        n_points = len(codes[0])
+        valid = np.ones(n_points, dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+
+        valid_codes = np.stack([dimension_codes[valid] for dimension_codes in codes], axis=1)
+        lows = valid_codes.min(axis=0) if len(valid_codes) else np.zeros(len(codes), dtype=np.int64)
+        spans = valid_codes.max(axis=0) - lows + 1 if len(valid_codes) else np.ones(len(codes), dtype=np.int64)
+
+        if math.prod(int(span) for span in spans) < 2**62:
+            # mixed radix packing, exact as long as the dense grid size fits into an int64
+            strides = np.cumprod(np.concatenate([[1], spans[:0:-1]]))[::-1]
+            keys, inverse = np.unique((valid_codes - lows) @ strides, return_inverse=True)
+            bin_codes = (keys[:, np.newaxis]//strides) % spans + lows
+        else:
+            bin_codes, inverse = np.unique(valid_codes, axis=0, return_inverse=True)
+
+        self.bin_ids = np.full(n_points, -1, dtype=np.int64)
+        self.bin_ids[valid] = inverse.ravel()
+        self.bin_codes = bin_codes.reshape(-1, len(codes))
+        self.n_bins = len(self.bin_codes)
+
+    def selected(self, values=None, keep=None):
+        """
+        Returns: Boolean array of data points with a bin, in keep and with a value
+        """
+        rows = self.bin_ids >= 0
+        if keep is not None:
+            rows &= keep
+        if values is not None:
+            rows &= ~np.isnan(values)
+
+        return rows
+
+    def count(self, values=None, keep=None):
+        """
+        Returns: Number of data points (with a value, if values are given) of every occupied bin
+        """
+        return np.bincount(self.bin_ids[self.selected(values, keep)], minlength=self.n_bins)
+
+    def mean(self, values, keep=None):
+        """
+        Returns: Mean of values in every occupied bin, NaN for bins without values
+        """
+        rows = self.selected(values, keep)
+        count = np.bincount(self.bin_ids[rows], minlength=self.n_bins)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.bincount(self.bin_ids[rows], weights=values[rows], minlength=self.n_bins)/count
+
+    def std(self, values, keep=None, ddof=1):
+        """
+        Returns: Standard deviation of values in every occupied bin, NaN for bins with ddof values or less
+        """
+        rows = self.selected(values, keep)
+        bin_ids = self.bin_ids[rows]
+        count = np.bincount(bin_ids, minlength=self.n_bins)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(bin_ids, weights=values[rows], minlength=self.n_bins)/count
+            # deviations from the bin means avoid the cancellation of sum of squares formulas
+            squared_deviation = np.bincount(bin_ids, weights=(values[rows] - mean[bin_ids])**2, minlength=self.n_bins)
+            return np.where(count > ddof, np.sqrt(squared_deviation/(count - ddof)), np.nan)
+
+    def median(self, values, keep=None):
+        """
+        Returns: Median of values in every occupied bin, NaN for bins without values
+        """
+        rows = self.selected(values, keep)
+        if not rows.any():
+            return np.full(self.n_bins, np.nan)
+
+        # sort values within bins, the middle values of every bin are then found from the bin counts
+        bin_ids = self.bin_ids[rows]
+        sorted_values = values[rows][np.lexsort((values[rows], bin_ids))]
+        count = np.bincount(bin_ids, minlength=self.n_bins)
+        starts = np.cumsum(count) - count
+        lower = np.clip(starts + (count - 1)//2, 0, len(sorted_values) - 1)
+        upper = np.clip(starts + count//2, 0, len(sorted_values) - 1)
+
+        return np.where(count > 0, (sorted_values[lower] + sorted_values[upper])/2, np.nan)
+
+
+def condition_bin_codes(data, condition_bins):
+    """
+    Bins conditioning variables such as air density, wind direction or temperature into uniform bins
+
+    condition_bins: Dictionary of column name and bin width, e.g. {'Ba_avg': 30} for wind direction sectors
+
+    Returns: List of integer bin code arrays, where code k is the interval [width*k, width*(k+1)),
+             and a boolean array of data points with a value for every conditioning variable
+    """
+    codes, valid = [], np.ones(len(data), dtype=bool)
+    for column, bin_width in (condition_bins or {}).items():
+        values = data[column].to_numpy(dtype=float)
+        valid &= ~np.isnan(values)
+        codes.append(np.floor(np.nan_to_num(values)/bin_width).astype(np.int64))
+
+    return codes, valid
+
+
+def sparse_binning_func(turbine_data, windspeed_label, power_label, bin_interval=0.5, condition_bins=None):
+    """
+    Bins wind speed, and optionally conditioning variables, into occupied bins only.
+    Wind speed bins and the returned statistics are the same as the ones of binning_func.
+
+    turbine_data:   pandas dataframe containing windspeed and power columns
+    condition_bins: Optional dictionary of conditioning column name and bin width
+
+    Returns: Integer wind speed bin code (k for the interval (bin_interval*k, bin_interval*(k+1)]),
+             one bin code column per conditioning variable, median wind speed, average and standard deviation
+             of produced power for each occupied bin
+    """
+    windspeed = turbine_data[windspeed_label].to_numpy(dtype=float)
+    power = turbine_data[power_label].to_numpy(dtype=float)
+
+    # bins only extend up to the maximum wind speed of the data, as in binning_func
+    max_windspeed = np.nanmax(windspeed) if np.isfinite(windspeed).any() else np.nan
+    bin_codes = windspeed_bin_codes(windspeed, bin_interval)
+    codes, valid = condition_bin_codes(turbine_data, condition_bins)
+    valid &= (bin_codes >= 0) & (bin_codes <= last_bin_codes(max_windspeed))
+
+    sparse_bins = SparseBins([bin_codes] + codes, valid)
+    binned_turb_df = pd.DataFrame(sparse_bins.bin_codes, columns=['windspeed_bin'] +
+                                  [f"{column}_bin" for column in (condition_bins or {})])
+    binned_turb_df['windspeed_bin_median'] = sparse_bins.median(windspeed)
+    binned_turb_df['pwr_bin_mean'] = sparse_bins.mean(power)
+    binned_turb_df['pwr_bin_std'] = sparse_bins.std(power)
+
+    return binned_turb_df.dropna(subset=['pwr_bin_mean']).fillna({'pwr_bin_std': 0}).reset_index(drop=True)
@@ -0,0 +1,70 @@
+"""
+This is a function for generating synthetic scada data of a wind farm with realistic power curves
+"""
+
+# Import relevant libraries
+import numpy as np
+import pandas as pd
+
+# names of the injected events, in order of their codes
+EVENT_NAMES = ['normal', 'downtime', 'curtailment', 'fault']
+
+
+def generate_scada_data(n_turbines=10, n_records=100000, rated_power=2050, cut_in_speed=3, rated_speed=13,
+                        cut_out_speed=25, downtime_fraction=0.03, curtailment_fraction=0.03, fault_fraction=0.02,
+                        start='2017-01-01', freq='10min', turbine_label='Wind_turbine_name',
+                        windspeed_label='Ws_avg', power_label='P_avg', timestamp_label='Date_time', seed=0):
+    """
+    Generates 10-minute scada data following a sigmoid power curve with measurement noise,
+    plus injected downtime, curtailment and fault events
+
+    n_turbines:           Number of turbines in the wind farm
+    n_records:            Total number of records, shared equally between turbines
+    rated_power:          Rated power of the turbines
+    cut_in_speed:         Cut in speed of the turbines
+    rated_speed:          Wind speed at which rated power is reached
+    cut_out_speed:        Wind speed above which turbines stop producing
+    downtime_fraction:    Fraction of records with no production
+    curtailment_fraction: Fraction of records with power capped below rated power
+    fault_fraction:       Fraction of records with unrealistically low power at moderate to high wind speeds
+    seed:                 Seed of the random number generator
+
+    Returns: Pandas dataframe of scada data, with the injected event of every record in an 'event' column
+    """
+    rng = np.random.default_rng(seed)
+    records_per_turbine = int(np.ceil(n_records/n_turbines))
+
+    # turbine labels are stored as categoricals, so the label column takes a few bytes per record
+    turbine_names = [f'WT{turbine:03d}' for turbine in range(1, n_turbines + 1)]
+    turbine_codes = np.repeat(np.arange(n_turbines, dtype=np.int32), records_per_turbine)[:n_records]
+    turbine = pd.Categorical.from_codes(turbine_codes, turbine_names)
+    timestamp = np.tile(pd.date_range(start, periods=records_per_turbine, freq=freq).values, n_turbines)[:n_records]
+
+    # Weibull distributed wind speed and a slightly different power curve per turbine
+    windspeed = rng.weibull(2, n_records)*7.5
+    turbine_shift = rng.normal(0, 0.3, n_turbines)[turbine_codes]
+    midpoint = (cut_in_speed + rated_speed)/2 + turbine_shift
+    power = rated_power/(1 + np.exp(-(windspeed - midpoint)*8/(rated_speed - cut_in_speed)))
+    power = np.where(windspeed < cut_in_speed, 0, power)
+    power = np.where(windspeed > cut_out_speed, 0, power)
+    power = power + rng.normal(0, 0.02*rated_power, n_records)*(power > 0) + rng.normal(0, 2, n_records)
+
+    event = np.zeros(n_records, dtype=np.int8)
+    event_draw = rng.random(n_records)
+
+    downtime = (event_draw < downtime_fraction) & (windspeed >= cut_in_speed)
+    power[downtime] = rng.uniform(-10, 1, downtime.sum())
+    event[downtime] = 1
+
+    curtailment = (event_draw >= downtime_fraction) & (event_draw < downtime_fraction + curtailment_fraction)
+    curtailment &= power > 0.5*rated_power
+    power[curtailment] = np.minimum(power[curtailment], rng.uniform(0.3, 0.6, curtailment.sum())*rated_power)
+    event[curtailment] = 2
+
+    fault = (event_draw >= 1 - fault_fraction) & (windspeed > cut_in_speed)
+    power[fault] *= rng.uniform(0.05, 0.6, fault.sum())
+    event[fault] = 3
+
+    return pd.DataFrame({turbine_label: turbine, timestamp_label: timestamp,
+                         windspeed_label: windspeed.round(2), power_label: power.round(2),
+                         'event': pd.Categorical.from_codes(event, EVENT_NAMES)})
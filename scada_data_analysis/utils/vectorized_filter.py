@@ -0,0 +1,158 @@
+"""
+These are array-based versions of the power curve filtering steps, applied to all turbines at once
+"""
+
+# Import relevant libraries
+import numpy as np
+import pandas as pd
+
+
+def windspeed_bin_codes(windspeed, bin_interval=0.5, max_windspeed=None):
+    """
+    Assigns an integer wind speed bin code to every data point
+
+    windspeed:     numpy array of wind speed values
+    bin_interval:  Wind speed bin interval
+    max_windspeed: Largest wind speed covered by the bins. Defaults to the maximum of windspeed,
+                   pass it explicitly to get consistent codes across chunks of data
+
+    Returns: Array of bin codes, where code k is the interval (bin_interval*k, bin_interval*(k+1)].
+             The intervals are right-closed, like the ones built by binning_func.
+             Points that fall outside every bin (zero, negative or missing wind speed) get -1.
+    """
+    windspeed = np.asarray(windspeed, dtype=float)
+    if max_windspeed is None:
+        max_windspeed = np.nanmax(windspeed) if np.isfinite(windspeed).any() else 0
+    n_bins = windspeed_bin_count(max_windspeed)
+
+    # right edges are rounded the same way binning_func rounds its interval boundaries
+    right_edges = np.round(bin_interval*np.arange(n_bins) + bin_interval, 2)
+    codes = np.searchsorted(right_edges, windspeed, side='left')
+
+    return np.where((windspeed > 0) & (codes < n_bins), codes, -1)
+
+
+def windspeed_bin_count(max_windspeed):
+    """
+    Returns the number of bin codes needed to cover wind speeds up to max_windspeed
+    """
+    return 2*max(int(max_windspeed), 0) + 2
+
+
+def last_bin_codes(max_windspeed):
+    """
+    Returns the code of the last wind speed bin up to which binning_func builds bins, 2*trunc(max_windspeed),
+    for a scalar or array of maximum wind speeds. NaN (no data) gives -2, below every bin.
+    """
+    return 2*np.trunc(np.nan_to_num(max_windspeed, nan=-1))
+
+
+def downtime_mask(windspeed, power, cut_in_speed=3):
+    """
+    Returns a boolean array that is True for downtime events
+    """
+    return (power <= 1) & (windspeed >= cut_in_speed)
+
+
+def fault_mask(turbine_codes, windspeed, power, keep, n_turbines, cut_in_speed=3):
+    """
+    Returns a boolean array that is True for data points with unrealistically low power output
+    at moderately high wind speeds. The maximum power of each turbine is taken over the points in keep.
+    """
+    max_power = group_max(power, turbine_codes, keep, n_turbines)
+
+    return keep & (power < 0.9*max_power[turbine_codes]) & (windspeed > 4.5*cut_in_speed)
+
+
+def iterative_filter(turbine_codes, bin_codes, windspeed, power, keep, n_turbines, cut_in_speed=3,
+                     z_coeff=2, filter_cycle=5, on_cycle=None, condition_codes=None):
+    """
+    Filters all turbines at once using provided threshold (z_coeff)
+
+    turbine_codes: integer turbine code of every data point, in the range [0, n_turbines)
+    bin_codes:     wind speed bin code of every data point, as returned by windspeed_bin_codes
+    keep:          boolean array of data points entering the first filter cycle
+    on_cycle:      optional callable, called as on_cycle(cycle, keep) after each filter cycle
+    condition_codes: optional integer code of every data point that bins are additionally split by,
+                   e.g. a wind direction sector, -1 for points that belong to no bin
+
+    Returns: Boolean array of data points retained after the last filter cycle
+    """
+    bin_codes = np.asarray(bin_codes, dtype=np.int64)
+    n_bins = int(bin_codes.max()) + 1 if len(bin_codes) else 1
+    group_codes = turbine_codes.astype(np.int64)*n_bins + bin_codes
+    in_bin = bin_codes >= 0
+    if condition_codes is not None:
+        n_conditions = max(int(condition_codes.max()), 0) + 1 if len(condition_codes) else 1
+        group_codes = group_codes*n_conditions + condition_codes
+        in_bin &= condition_codes >= 0
+    below_cut_in = windspeed < cut_in_speed
+
+    for cycle in range(1, int(filter_cycle) + 1):
+        # a turbine's bins only extend up to its current maximum wind speed
+        max_windspeed = group_max(windspeed, turbine_codes, keep, n_turbines)
+        last_bin = last_bin_codes(max_windspeed)
+        binned = keep & in_bin & (bin_codes <= last_bin[turbine_codes])
+
+        grouped_power = pd.Series(power[binned]).groupby(group_codes[binned])
+        pwr_bin_mean = np.full(len(power), np.nan)
+        pwr_bin_std = np.full(len(power), np.nan)
+        pwr_bin_mean[binned] = grouped_power.transform('mean').to_numpy()
+        pwr_bin_std[binned] = grouped_power.transform('std').fillna(0).to_numpy()
+
+        pwr_low_thresh, pwr_high_thresh = power_thresholds(pwr_bin_mean, pwr_bin_std, z_coeff)
+
+        keep = keep & (((power > pwr_low_thresh) & (power < pwr_high_thresh)) | below_cut_in)
+
+        if on_cycle is not None:
+            on_cycle(cycle, keep)
+
+    return keep
+
+
+def threshold_mask(turbine_codes, bin_codes, windspeed, power, keep, max_power, thresholds, cut_in_speed=3):
+    """
+    Screens data points against stored filter results instead of statistics of the data itself
+
+    keep:          boolean array of data points to screen, e.g. points of turbines with stored thresholds
+    max_power:     maximum power of the turbine of every data point, used to remove fault events
+    thresholds:    list of (pwr_low_thresh, pwr_high_thresh) arrays of shape (turbines, bins), as returned
+                   by power_thresholds for every filter cycle
+
+    Returns: Boolean array of data points in keep that are neither downtime nor fault events and lie within
+             the thresholds of their (turbine, bin) for every filter cycle, or below cut in speed
+    """
+    keep = keep & ~downtime_mask(windspeed, power, cut_in_speed)
+    keep &= ~((power < 0.9*max_power) & (windspeed > 4.5*cut_in_speed))
+
+    below_cut_in = windspeed < cut_in_speed
+    for pwr_low_thresh, pwr_high_thresh in thresholds:
+        binned = keep & (bin_codes >= 0) & (bin_codes < pwr_low_thresh.shape[1])
+        flat_codes = np.where(binned, turbine_codes*pwr_low_thresh.shape[1] + bin_codes, 0)
+        low = np.where(binned, pwr_low_thresh.ravel()[flat_codes], np.nan)
+        high = np.where(binned, pwr_high_thresh.ravel()[flat_codes], np.nan)
+        keep &= ((power > low) & (power < high)) | below_cut_in
+
+    return keep
+
+
+def power_thresholds(pwr_bin_mean, pwr_bin_std, z_coeff=2):
+    """
+    Returns the lower and upper power thresholds of normal operation, with negative values set to 0.
+    Missing bin statistics give missing thresholds, which reject every data point.
+    """
+    pwr_low_thresh = pwr_bin_mean - z_coeff*pwr_bin_std
+    pwr_low_thresh = np.where(pwr_low_thresh < 0, 0, pwr_low_thresh)
+    pwr_high_thresh = pwr_bin_mean + z_coeff*pwr_bin_std
+    pwr_high_thresh = np.where(pwr_high_thresh < 0, 0, pwr_high_thresh)
+
+    return pwr_low_thresh, pwr_high_thresh
+
+
+def group_max(values, turbine_codes, keep, n_turbines):
+    """
+    Returns the maximum of values over the points in keep for each turbine code (NaN if there are none)
+    """
+    max_values = pd.Series(values[keep]).groupby(turbine_codes[keep]).max()
+
+    return max_values.reindex(np.arange(n_turbines)).to_numpy(dtype=float)
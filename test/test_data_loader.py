@@ -0,0 +1,47 @@
+"""
+This script performs test on the scada data loader
+"""
+import os
+import sys
+sys.path.extend(['.', '..'])
+
+import tempfile
+import unittest
+import numpy as np
+
+from scada_data_analysis.utils.data_loader import load_scada_data
+from scada_data_analysis.utils.synthetic_data import generate_scada_data
+from scada_data_analysis.modules.power_curve_preprocessing import PowerCurveFiltering
+
+
+class TestDataLoader(unittest.TestCase):
+    def setUp(self):
+        self.df = generate_scada_data(n_turbines=3, n_records=6000, seed=2)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'scada.zip')
+        self.df.to_csv(self.path, index=False)
+
+    def test_data_loader_results(self):
+        turbines = self.df['Wind_turbine_name'].unique()[:2]
+        scada_df = load_scada_data(self.path, 'Wind_turbine_name', 'Ws_avg', 'P_avg', 'Date_time',
+                                   turbines=turbines, start='2017-01-03', end='2017-01-05', chunksize=1000)
+        expected_df = self.df[self.df['Wind_turbine_name'].isin(turbines) &
+                              (self.df['Date_time'] >= '2017-01-03') & (self.df['Date_time'] < '2017-01-05')]
+
+        # Test projected columns, compact dtypes and selected rows
+        assert list(scada_df.columns) == ['Wind_turbine_name', 'Ws_avg', 'P_avg', 'Date_time'], "Unexpected columns loaded"
+        assert scada_df['Wind_turbine_name'].dtype == 'category', "Turbine labels not loaded as categorical"
+        assert scada_df['Ws_avg'].dtype == np.float32 and scada_df['P_avg'].dtype == np.float32, "Measurements not loaded as float32"
+        assert len(scada_df) == len(expected_df), "Turbine or time range filter selects wrong rows"
+
+        # Test that loaded data is accepted by the filter
+        normal_df, abnormal_df = PowerCurveFiltering(turbine_label='Wind_turbine_name', windspeed_label='Ws_avg',
+                                                     power_label='P_avg', data=scada_df, z_coeff=2.5).process()
+        assert len(normal_df) + len(abnormal_df) == len(scada_df), "Filtered data does not cover the loaded data"
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
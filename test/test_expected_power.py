@@ -1,14 +1,17 @@
 """
 This script performs test on the power curve filtering module
 """
+import os
 import sys
 sys.path.extend(['.', '..'])
 
+import tempfile
 import unittest
 import pandas as pd
 
 from sklearn.metrics import mean_squared_error
 from scada_data_analysis.modules.expected_power import ExpectedPower
+from scada_data_analysis.utils.filter_cache import FilterCache
 
 
 class TestExpectedPower(unittest.TestCase):
@@ -39,6 +42,159 @@ class TestExpectedPower(unittest.TestCase):
         # test returned shape of subsets
         assert computed_score == expected_score, "Returned score of expected power estimation does not match expected score"
    
+    def test_compiled_predict_results(self):
+
+        self.run_calculations('linear')
+        compiled_pred = self.power_model.predict(self.test_df, compiled=True, return_series=True)
+
+        # Test that the compiled path matches the interpolation functions within grid resolution
+        assert compiled_pred.index.equals(self.test_df.index), "Compiled predictions are not aligned with test data"
+        assert (compiled_pred - self.pred_df['expected_power']).abs().max() < 0.01, "Compiled predictions deviate from interpolation"
+
+    def test_chunked_fit_results(self):
+
+        expected_score = self.run_calculations('linear')
+
+        chunks = [self.train_df[start:start + 10000] for start in range(0, len(self.train_df), 10000)]
+        chunk_model = ExpectedPower(turbine_label='title', windspeed_label='Ws_avg',
+                                    power_label='P_avg', method='binning', kind='linear').fit_chunks(chunks)
+        chunk_pred_df = chunk_model.predict(self.test_df)
+        computed_score = mean_squared_error(chunk_pred_df['P_avg'], chunk_pred_df['expected_power'], squared=False)
+
+        # Test that bin means of wind speed give a score close to bin medians
+        assert abs(computed_score - expected_score) < 1, "Chunked fit score deviates from in-memory fit score"
+
+    def test_partial_fit_results(self):
+
+        expected_score = self.run_calculations('linear')
+
+        partial_model = ExpectedPower(turbine_label='title', windspeed_label='Ws_avg',
+                                      power_label='P_avg', method='binning', kind='linear')
+        partial_model = partial_model.fit(self.train_df[:30000]).partial_fit(self.train_df[30000:])
+        partial_pred_df = partial_model.predict(self.test_df)
+        computed_score = mean_squared_error(partial_pred_df['P_avg'], partial_pred_df['expected_power'], squared=False)
+
+        # Test that updating the model with new data gives a score close to refitting on all data
+        assert abs(computed_score - expected_score) < 2, "Partial fit score deviates from full fit score"
+        assert partial_model.turbine_max_power[0] == self.power_model.turbine_max_power[0], "Fault threshold differs from full fit"
+
+        # Test that new data at wind speeds not seen so far extends the curve
+        low_wind = self.train_df['Ws_avg'] < 9
+        partial_model = ExpectedPower(turbine_label='title', windspeed_label='Ws_avg',
+                                      power_label='P_avg', method='binning', kind='linear')
+        partial_model = partial_model.fit(self.train_df[low_wind]).partial_fit(self.train_df[~low_wind])
+        full_max_power = self.power_model.max_power_dict['R80721']
+        assert partial_model.pred_funcs_dict['R80721'].x.max() > 15, "Curve not extended to new wind speeds"
+        assert abs(partial_model.max_power_dict['R80721'] - full_max_power) < 0.02*full_max_power, "Clip limit not updated"
+
+    def test_save_load_results(self):
+
+        self.run_calculations('cubic')
+
+        with tempfile.TemporaryDirectory() as model_path:
+            self.power_model.save(model_path)
+            loaded_model = ExpectedPower.load(model_path)
+            loaded_pred_df = loaded_model.predict(self.test_df)
+
+            # release memory-mapped arrays before the directory is removed
+            del loaded_model
+
+        # Test that a loaded model gives the same predictions as the fitted model
+        pd.testing.assert_series_equal(loaded_pred_df['expected_power'], self.pred_df['expected_power'])
+
+    def test_parallel_fit_results(self):
+
+        # split sample data into several turbines to exercise per-turbine workers
+        fleet_train_df = self.train_df.copy()
+        fleet_train_df['title'] = fleet_train_df['title'] + '_' + (fleet_train_df.index % 3).astype(str)
+        fleet_test_df = self.test_df.copy()
+        fleet_test_df['title'] = fleet_test_df['title'] + '_' + (fleet_test_df.index % 3).astype(str)
+
+        pred_list = []
+        for n_jobs in [1, 2]:
+            power_model = ExpectedPower(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg',
+                                        method='binning', kind='linear', n_jobs=n_jobs)
+            power_model = power_model.fit(fleet_train_df)
+            pred_list.append(power_model.predict(fleet_test_df))
+
+        # Test that parallel fitting gives the same training data and predictions as serial fitting
+        assert power_model.normal_df.shape[0] > 0, "Parallel fit returned no normal operating data"
+        pd.testing.assert_series_equal(pred_list[0]['expected_power'], pred_list[1]['expected_power'])
+
+    def test_filter_cache_results(self):
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            pred_list = []
+            for kind, cache in [('cubic', FilterCache(cache_dir=cache_dir)), ('linear', FilterCache(cache_dir=cache_dir))]:
+                power_model = ExpectedPower(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg',
+                                            method='binning', kind=kind, cache=cache)
+                pred_list.append(power_model.fit(self.train_df).predict(self.test_df))
+
+            # Test that clearing the cache keeps other files of its directory, e.g. a saved model
+            power_model.save(cache_dir)
+            cache.clear()
+            assert sorted(os.listdir(cache_dir)) == ['bin_stats.npy', 'curves.npy', 'metadata.json'], "Cache removed other files"
+
+        # Test that the second cache reuses the filtering result saved on disk by the first
+        assert cache.hits == 1 and cache.misses == 0, "Filtering result not reused from disk cache"
+        computed_score = round(mean_squared_error(pred_list[1]['P_avg'], pred_list[1]['expected_power'], squared=False), 6)
+        assert computed_score == 80.904492, "Cached fit does not give the same predictions as an uncached fit"
+
+    def test_sparse_binning_results(self):
+
+        power_model = ExpectedPower(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg',
+                                    method='binning', kind='linear', binning='sparse')
+        pred_df = power_model.fit(self.train_df).predict(self.test_df)
+        computed_score = round(mean_squared_error(pred_df['P_avg'], pred_df['expected_power'], squared=False), 6)
+
+        # Test that sparse binning gives the same curves as binning_func
+        assert computed_score == 80.904492, "Sparse binning does not give the same predictions as interval binning"
+
+        # Test that conditioned curves are fitted and used for prediction
+        power_model = ExpectedPower(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg',
+                                    method='binning', kind='linear', binning='sparse', condition_bins={'Ba_avg': 180})
+        conditioned_pred_df = power_model.fit(self.train_df.assign(Ba_avg=self.train_df.index % 360)).predict(
+            self.test_df.assign(Ba_avg=self.test_df.index % 360))
+        assert len(power_model.condition_funcs_dict) == 2, "Curves not fitted per condition bin"
+        assert conditioned_pred_df['expected_power'].notna().all(), "Missing expected power with conditioned curves"
+
+    def test_energy_losses_results(self):
+
+        self.run_calculations('linear')
+        test_df = self.test_df.assign(Date_time=pd.date_range('2020-01-01', periods=len(self.test_df), freq='10min'))
+        chunk_list = [test_df[start:start + 2000] for start in range(0, len(test_df), 2000)]
+
+        # Test that streamed predictions match predictions of the whole test data
+        streamed_pred_df = pd.concat(self.power_model.predict_iter(chunk_list))
+        pd.testing.assert_series_equal(streamed_pred_df['expected_power'], self.pred_df['expected_power'])
+
+        # Test that daily energy sums add up to the energy of the whole test data
+        energy_df = self.power_model.energy_losses(chunk_list, 'Date_time', freq='D', compiled=False)
+        assert len(energy_df) == test_df['Date_time'].dt.normalize().nunique(), "Unexpected number of daily periods"
+        assert abs(energy_df['expected_energy'].sum() - self.pred_df['expected_power'].sum()/6) < 1e-3, "Expected energy does not add up"
+        assert abs(energy_df['lost_energy'].sum() - (self.pred_df['expected_power'] - self.pred_df['P_avg']).sum()/6) < 1e-3, "Lost energy does not add up"
+
+    def test_automl_results(self):
+
+        power_model = ExpectedPower(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg',
+                                    method='autoML', kind='linear').fit(self.train_df)
+        pred_df = power_model.predict(self.test_df)
+
+        # Test that the fleet model scores every row within the clip limits with an error close to binning
+        assert pred_df['expected_power'].notna().all(), "Missing expected power of the autoML method"
+        assert pred_df['expected_power'].between(0, power_model.max_power_dict['R80721']).all(), "Expected power not clipped"
+        assert mean_squared_error(pred_df['P_avg'], pred_df['expected_power'], squared=False) < 85, "AutoML error too large"
+
+        # Test that the saved model gives the same predictions
+        with tempfile.TemporaryDirectory() as path:
+            power_model.save(path)
+            pd.testing.assert_series_equal(ExpectedPower.load(path).predict(self.test_df, return_series=True),
+                                           pred_df['expected_power'])
+
+        # Test that partial_fit warns that the autoML model is not retrained
+        with self.assertWarns(UserWarning):
+            power_model.partial_fit(self.test_df)
+
     def tearDown(self) -> None:
         pass
         
@@ -0,0 +1,52 @@
+"""
+This script performs test on the filter parameter sweep module
+"""
+import sys
+sys.path.extend(['.', '..'])
+
+import unittest
+import pandas as pd
+
+from scada_data_analysis.modules.parameter_sweep import FilterParameterSweep
+
+
+class TestFilterParameterSweep(unittest.TestCase):
+    def setUp(self):
+        try:
+            self.df = pd.read_csv(r'examples/datasets/sample_df.csv')
+        except:
+            self.df = pd.read_csv(r'examples\datasets\sample_df.csv')
+
+        # split data into train and test data
+        self.train_df = self.df[:38000].reset_index(drop=True)
+        self.test_df = self.df[38000:].reset_index(drop=True)
+
+    def test_parameter_sweep_results(self):
+
+        sweep = FilterParameterSweep(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg',
+                                     z_coeffs=[2, 2.5], filter_cycles=[3, 5], bin_intervals=[0.5, 1.0], kind='linear')
+        results_df = sweep.run(self.train_df, self.test_df)
+
+        default_result = results_df[(results_df['bin_interval'] == 0.5) & (results_df['z_coeff'] == 2) &
+                                    (results_df['filter_cycle'] == 5)]
+        computed_score = round(default_result['rmse'].iloc[0], 6)
+        expected_score = 80.904492
+
+        # Test that every combination is evaluated
+        assert len(results_df) == 8, "Returned results do not cover every parameter combination"
+
+        # Test that the sweep reproduces the score of a separate ExpectedPower fit
+        assert computed_score == expected_score, "Sweep score does not match expected power estimation score"
+
+        # Test that filter cycles below 1 are rejected instead of skipped
+        sweep = FilterParameterSweep(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg',
+                                     filter_cycles=[0, 1])
+        with self.assertRaises(ValueError):
+            sweep.run(self.train_df)
+
+    def tearDown(self) -> None:
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,18 @@
 """
 This script performs test on the power curve filtering module
 """
+import os
 import sys
 sys.path.extend(['.', '..'])
 
+import tempfile
 import unittest
+import tracemalloc
+import numpy as np
 import pandas as pd
 
-from scada_data_analysis.modules.power_curve_preprocessing import PowerCurveFiltering
+from scada_data_analysis.modules.power_curve_preprocessing import PowerCurveFiltering, NORMAL, DOWNTIME, NO_TURBINE
+from scada_data_analysis.utils.instrumentation import StageProfiler
 
 
 class TestPowerCurveFiltering(unittest.TestCase):
@@ -40,6 +45,113 @@ class TestPowerCurveFiltering(unittest.TestCase):
         # Test results for abnormal operating conditions
         assert set(expected_abnormal_indices).issubset(set(computed_abnormal_indices)), "Expected abnormal operating data not in computed results"
         
+    def test_vectorized_engine_results(self):
+
+        # split sample data into several turbines to exercise fleet-wide filtering
+        fleet_df = self.df.copy()
+        fleet_df['title'] = fleet_df['title'] + '_' + (fleet_df.index % 3).astype(str)
+
+        split_results = []
+        for engine in ['pandas', 'vectorized']:
+            pc_filter = PowerCurveFiltering(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg', data=fleet_df,
+                                            cut_in_speed=3, bin_interval=0.5, z_coeff=2.5, filter_cycle=5, engine=engine)
+            normal_df, abnormal_df = pc_filter.process()
+            split_results.append((set(normal_df.index), set(abnormal_df.index)))
+
+        # Test that both engines return the same normal/abnormal split
+        assert split_results[0] == split_results[1], "Vectorized engine split does not match pandas engine split"
+
+    def test_sparse_binning_results(self):
+
+        # add a wind direction-like variable to condition bins on
+        conditioned_df = self.df.copy()
+        conditioned_df['Ba_avg'] = (conditioned_df.index*37) % 360
+
+        codes_list = []
+        for engine, binning, condition_bins in [('pandas', 'interval', None), ('pandas', 'sparse', None),
+                                                ('pandas', 'sparse', {'Ba_avg': 90}), ('vectorized', 'interval', {'Ba_avg': 90})]:
+            pc_filter = PowerCurveFiltering(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg',
+                                            data=conditioned_df, z_coeff=2.5, engine=engine, binning=binning,
+                                            condition_bins=condition_bins)
+            codes_list.append(pc_filter.process(output='codes'))
+
+        # Test that sparse binning gives the same reason codes as interval binning, with and without conditions
+        np.testing.assert_array_equal(codes_list[0], codes_list[1])
+        np.testing.assert_array_equal(codes_list[2], codes_list[3])
+
+    def test_chunked_filtering_results(self):
+
+        chunks = [self.df[start:start + 10000] for start in range(0, len(self.df), 10000)]
+        chunk_filter = PowerCurveFiltering(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg',
+                                           cut_in_speed=3, bin_interval=0.5, z_coeff=2.5, filter_cycle=5)
+        chunk_results = list(chunk_filter.process_chunks(chunks))
+
+        computed_normal_indices = pd.concat([normal_df for normal_df, _ in chunk_results]).index
+        computed_abnormal_indices = pd.concat([abnormal_df for _, abnormal_df in chunk_results]).index
+
+        # Test that filtering in chunks returns the same split as filtering in memory
+        assert set(computed_normal_indices) == set(self.normal_df.index), "Chunked normal data does not match in-memory results"
+        assert set(computed_abnormal_indices) == set(self.abnormal_df.index), "Chunked abnormal data does not match in-memory results"
+
+    def test_reason_codes_results(self):
+
+        code_list = []
+        for engine in ['pandas', 'vectorized']:
+            pc_filter = PowerCurveFiltering(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg', data=self.df,
+                                            cut_in_speed=3, bin_interval=0.5, z_coeff=2.5, filter_cycle=5, engine=engine)
+            code_list.append(pc_filter.process(output='codes'))
+
+        computed_normal_indices = self.df.index[code_list[0] == NORMAL]
+
+        # Test that reason codes are compact, agree between engines and match the normal data
+        assert code_list[0].dtype == np.int8 and len(code_list[0]) == len(self.df), "Reason codes not aligned with input data"
+        assert (code_list[0] == code_list[1]).all(), "Reason codes of pandas and vectorized engines differ"
+        assert set(computed_normal_indices) == set(self.normal_df.index), "Rows with normal code do not match normal data"
+        assert code_list[0][4] == DOWNTIME, "Downtime event not labelled as downtime"
+
+        # Test that rows without a turbine label get their own code with the pandas engine
+        missing_label_df = self.df.copy()
+        missing_label_df.loc[0, 'title'] = np.nan
+        pc_filter = PowerCurveFiltering(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg',
+                                        data=missing_label_df, cut_in_speed=3, bin_interval=0.5, z_coeff=2.5,
+                                        filter_cycle=5, engine='pandas')
+        reason_codes = pc_filter.process(output='codes')
+        assert reason_codes[0] == NO_TURBINE, "Row without turbine label not labelled as missing turbine"
+        assert (reason_codes[1:] == code_list[0][1:]).sum() > 0.99*(len(self.df) - 1), "Labelled rows not filtered"
+
+    def test_raster_figure_results(self):
+
+        with tempfile.TemporaryDirectory() as image_path:
+            pc_filter = PowerCurveFiltering(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg', data=self.df,
+                                            cut_in_speed=3, bin_interval=0.5, z_coeff=2.5, filter_cycle=5, engine='vectorized',
+                                            return_fig=True, image_path=image_path, fig_backend='raster')
+            pc_filter.process()
+
+            # Test that one image is saved per turbine
+            assert os.listdir(image_path) == ['R80721_pc.png'], "Power curve image not saved for every turbine"
+
+    def test_stage_profiler_results(self):
+
+        for engine in ['pandas', 'vectorized']:
+            profiler = StageProfiler()
+            pc_filter = PowerCurveFiltering(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg', data=self.df,
+                                            cut_in_speed=3, bin_interval=0.5, z_coeff=2.5, filter_cycle=5, engine=engine,
+                                            profiler=profiler)
+            normal_df, _ = pc_filter.process()
+            stage_df = profiler.to_frame()
+            cycle_df = stage_df[(stage_df['stage'] == 'secondary_filter') & stage_df['turbine'].notna()]
+
+            # Test that every filter cycle is recorded and the last cycle returns the normal data
+            assert cycle_df['cycle'].tolist() == [1, 2, 3, 4, 5], "Filter cycles not recorded by profiler"
+            assert cycle_df['rows_out'].iloc[-1] == len(normal_df), "Rows out of last filter cycle do not match normal data"
+
+            # Test that memory tracing started by the profiler is stopped once filtering returns
+            profiler = StageProfiler(trace_memory=True)
+            PowerCurveFiltering(turbine_label='title', windspeed_label='Ws_avg', power_label='P_avg', data=self.df,
+                                engine=engine, profiler=profiler).process()
+            assert not tracemalloc.is_tracing(), "Memory tracing left running by profiler"
+            assert profiler.to_frame()['peak_memory_mb'].notna().any(), "Peak memory not recorded"
+
     def tearDown(self) -> None:
         pass
         
@@ -0,0 +1,47 @@
+"""
+This script performs test on the time-windowed power curve store
+"""
+import sys
+sys.path.extend(['.', '..'])
+
+import unittest
+import numpy as np
+
+from scada_data_analysis.utils.synthetic_data import generate_scada_data
+from scada_data_analysis.modules.power_curve_store import PowerCurveStore
+from scada_data_analysis.modules.expected_power import ExpectedPower
+
+
+class TestPowerCurveStore(unittest.TestCase):
+    def setUp(self):
+        self.df = generate_scada_data(n_turbines=3, n_records=60000, seed=4)
+        self.labels = dict(turbine_label='Wind_turbine_name', windspeed_label='Ws_avg', power_label='P_avg')
+        self.store = PowerCurveStore(timestamp_label='Date_time', freq='M', **self.labels).add(self.df)
+
+    def test_power_curve_store_results(self):
+
+        # Test that the window of all periods gives the same curves as fitting the whole data
+        power_model = ExpectedPower(method='binning', kind='linear', engine='vectorized', **self.labels)
+        power_model = power_model.fit_chunks([self.df])
+        pred_df = power_model.predict(self.df)
+        window_model = self.store.window_model()
+        window_pred_df = window_model.predict(self.df)
+        assert np.allclose(window_pred_df['expected_power'], pred_df['expected_power']), "Window model differs from fit"
+        assert np.allclose(window_model.turbine_max_power, power_model.turbine_max_power), "Fault threshold differs from fit"
+
+        # Test that window curves only count data of their periods, apart from bins beyond the maximum wind speed
+        window_curves = self.store.window_curves('2017-02', '2017-03')
+        normal_count = self.store.period_stats[0][:, 1:3].sum()
+        assert 0.99*normal_count < window_curves['count'].sum() <= normal_count, "Window curves do not count the data of their periods"
+
+        # Test drift report of every turbine
+        drift_df = self.store.drift(('2017-01', '2017-02'), ('2017-03', None))
+        assert len(drift_df) == 3 and drift_df['common_bins'].gt(0).all(), "Drift not reported for every turbine"
+        assert drift_df['relative_power_change'].abs().lt(0.05).all(), "Unexpected drift of synthetic power curves"
+
+    def tearDown(self) -> None:
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()
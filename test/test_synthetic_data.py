@@ -0,0 +1,37 @@
+"""
+This script performs test on the synthetic scada data generator
+"""
+import sys
+sys.path.extend(['.', '..'])
+
+import unittest
+
+from scada_data_analysis.utils.synthetic_data import generate_scada_data
+from scada_data_analysis.modules.power_curve_preprocessing import PowerCurveFiltering
+
+
+class TestSyntheticData(unittest.TestCase):
+    def setUp(self):
+        self.df = generate_scada_data(n_turbines=4, n_records=40000, seed=1)
+
+    def test_synthetic_data_results(self):
+
+        pc_filter = PowerCurveFiltering(turbine_label='Wind_turbine_name', windspeed_label='Ws_avg', power_label='P_avg',
+                                        data=self.df, z_coeff=2.5, engine='vectorized')
+        normal_df, _ = pc_filter.process()
+        normal_share = self.df.index.isin(normal_df.index)
+
+        # Test returned shape and number of turbines
+        assert self.df.shape[0] == 40000, "Generated data does not have the requested number of records"
+        assert self.df['Wind_turbine_name'].nunique() == 4, "Generated data does not have the requested number of turbines"
+
+        # Test that injected downtime is removed and most normal records are kept by the filter
+        assert not normal_share[(self.df['event'] == 'downtime').to_numpy()].any(), "Injected downtime not removed by filter"
+        assert normal_share[(self.df['event'] == 'normal').to_numpy()].mean() > 0.9, "Filter removes too many normal records"
+
+    def tearDown(self) -> None:
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()